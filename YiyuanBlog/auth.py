@@ -1,16 +1,19 @@
+import uuid
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Optional
 
 import jwt
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
 # from typing import Any, Optional
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, AnonymousUser
 from django.http import HttpRequest
 from ninja.errors import HttpError
 from ninja.security import HttpBearer
 
-from user.models import User
+from user.revocation import TokenRevocation
+from user.services import UserCache
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = 'HS256'
@@ -18,6 +21,55 @@ ACCESS_TOKEN_EXPIRATION = 8  # 8 周
 REFSHE_TOKEN_EXPIRATION = 16  # 16 周
 
 
+# 同一個請求解碼後的使用者, 記在 request 上, 嚴格與可選認證共用
+_REQUEST_USER_ATTR = '_jwt_user'
+
+
+def _user_from_token(token: str) -> AbstractUser:
+    """
+    解碼 access token 並取得使用者, 失敗時回傳 401
+    """
+    try:
+        # 解碼 token
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HttpError(401, '逾期 Token')
+    except jwt.InvalidTokenError as e:
+        raise HttpError(401, f'失效 token: {str(e)}')
+
+    # 確認是訪問 token
+    if payload.get('type') != 'access':
+        raise HttpError(401, '無效的 access token')
+
+    return _user_from_payload(payload)
+
+
+def _user_from_payload(payload: dict[str, Any]) -> AbstractUser:
+    """
+    由已驗證簽章的 payload 取得使用者, 並確認 token 沒有被撤銷
+    """
+    # 大部分 jti 不在 Bloom filter 中, 不需要查詢資料庫
+    jti = payload.get('jti')
+    if jti and TokenRevocation.is_revoked(jti):
+        raise HttpError(401, 'token 已撤銷, 請重新登入')
+
+    # 從 payload 取得使用者 id
+    user_id = payload.get('user_id')
+    if user_id is None:
+        raise HttpError(401, '無效的 token: 缺少使用者')
+
+    # 以主鍵從快取取得 user, 快取沒有才查詢資料庫
+    user = UserCache.get(user_id)
+    if user is None:
+        raise HttpError(401, '找不到使用者')
+
+    # 修改密碼之前簽發的 token 全部失效
+    valid_after = user.token_valid_after
+    if valid_after and payload.get('iat', 0) < valid_after.timestamp():
+        raise HttpError(401, 'token 已失效, 請重新登入')
+    return user
+
+
 class JWTAuth(HttpBearer):
     """
     嚴格的 JWT 認證類別
@@ -25,57 +77,80 @@ class JWTAuth(HttpBearer):
     """
 
     def authenticate(self, request: HttpRequest, token: str) -> AbstractUser:
-        try:
-            # 解碼 token
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user = getattr(request, _REQUEST_USER_ATTR, None)
+        if user is None:
+            user = _user_from_token(token)
+            setattr(request, _REQUEST_USER_ATTR, user)
+        return user  # 回傳 user 物件, 方便在 API 使用
+
 
-            # 確認是訪問 token
-            if payload.get('type') != 'access':
-                raise HttpError(401, '無效的 access token')
+class OptionalJWTAuth(HttpBearer):
+    """
+    可選的 JWT 認證類別
+    - 沒有 token, 標頭格式錯誤或 token 無效時視為訪客, 回傳 AnonymousUser
+    - 每個請求只解碼一次, 之後呼叫 get_optional_user 不需要再解碼或查詢
+    """
 
-            # 從 payload 取得信箱
-            email = payload.get('email')
-            if email is None:
-                raise HttpError(401, '無效的 token: 缺少信箱')
+    def __call__(self, request: HttpRequest) -> AbstractUser | AnonymousUser:
+        # ninja 只接受 truthy 的認證結果, 訪客回傳 AnonymousUser
+        return get_optional_user(request) or AnonymousUser()
 
-            # 透過 email 確認 user 是否存在
-            user = User.objects.filter(email=email).first()
-            if user is None:
-                raise HttpError(401, '找不到使用者')
-            print(f'使用嚴格認證, 目前使用者: {user}')
-            return user  # 回傳 user 物件, 方便在 API 使用
+    def authenticate(self, request: HttpRequest, token: str) -> AbstractUser | None:
+        return get_optional_user(request)
 
-        except jwt.ExpiredSignatureError:
-            raise HttpError(401, '逾期 Token')
-        except jwt.InvalidTokenError as e:
-            print(f'失效 token: {e}')
-            raise HttpError(401, f'失效 token: {str(e)}')
+
+class AsyncJWTAuth(JWTAuth):
+    """
+    非同步端點使用的嚴格 JWT 認證
+    - 使用者快取可能查詢資料庫, 在執行緒中執行, 不阻塞 event loop
+    """
+
+    async def authenticate(self, request: HttpRequest, token: str) -> AbstractUser:
+        return await sync_to_async(super().authenticate)(request, token)
+
+
+class AsyncOptionalJWTAuth(OptionalJWTAuth):
+    """
+    非同步端點使用的可選 JWT 認證
+    """
+
+    async def __call__(self, request: HttpRequest) -> AbstractUser | AnonymousUser:
+        return await aget_optional_user(request) or AnonymousUser()
+
+    async def authenticate(
+        self, request: HttpRequest, token: str
+    ) -> AbstractUser | None:
+        return await aget_optional_user(request)
 
 
-# 手動寫的可選認證
 def get_optional_user(request: HttpRequest) -> Optional[AbstractUser]:
     """
-    輔助函式
+    取得當前登入使用者, 訪客回傳 None
+    - 結果記在 request 上, 同一個請求重複呼叫不會再解碼 token
     """
-    auth_value = request.headers.get('Authorization')
-    if not auth_value:
-        print('訪客使用者, 無須認證')
-        return None
+    if hasattr(request, _REQUEST_USER_ATTR):
+        return getattr(request, _REQUEST_USER_ATTR)
+
+    user = None
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token.strip():
+        try:
+            user = _user_from_token(token.strip())
+        except HttpError:
+            # 無效的 token 認定為訪客
+            user = None
 
-    token = auth_value.split(' ')[1]
+    setattr(request, _REQUEST_USER_ATTR, user)
+    return user
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        if payload.get('type') == 'access':
-            email = payload.get('email')
-            if email:
-                user = User.objects.filter(email=email).first()
-                print(f'使用可選認證, 目前使用者: {user}')
-                return user
 
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, User.DoesNotExist):
-        print('解碼錯誤, 認定為訪客')
-        return None
+async def aget_optional_user(request: HttpRequest) -> Optional[AbstractUser]:
+    """
+    get_optional_user 的非同步版本, 已經認證過的請求直接回傳結果
+    """
+    if hasattr(request, _REQUEST_USER_ATTR):
+        return getattr(request, _REQUEST_USER_ATTR)
+    return await sync_to_async(get_optional_user)(request)
 
 
 # 產生 access token
@@ -87,6 +162,7 @@ def generate_access_token(user_id: int, email: str) -> str:
         'user_id': user_id,
         'email': email,
         'type': 'access',
+        'jti': uuid.uuid4().hex,  # 撤銷 token 時使用
         'iat': datetime.now(timezone.utc),  # 生成時間
         'exp': datetime.now(timezone.utc)
         + timedelta(weeks=ACCESS_TOKEN_EXPIRATION),  # 到期時間
@@ -104,6 +180,7 @@ def generate_refresh_token(user_id: int, email: str) -> str:
         'user_id': user_id,
         'email': email,
         'type': 'refresh',
+        'jti': uuid.uuid4().hex,  # 撤銷 token 時使用
         'iat': datetime.now(timezone.utc),  # 生成時間
         'exp': datetime.now(timezone.utc)
         + timedelta(weeks=REFSHE_TOKEN_EXPIRATION),  # 到期時間
@@ -122,13 +199,8 @@ def refreshed_token(refresh_token: str) -> str:
         if payload.get('type') != 'refresh':
             raise HttpError(401, '無效的 refresh token')
 
-        # 透過 email 取得 user
-        email = payload.get('email')
-        user = User.objects.filter(email=email).first()
-
-        # 確認使用者存在
-        if user is None:
-            raise HttpError(401, '找不到使用者')
+        # 確認 token 沒有被撤銷, 並取得 user
+        user = _user_from_payload(payload)
 
         # 生成新的 access token
         new_access_token = generate_access_token(user.id, user.email)
@@ -139,3 +211,19 @@ def refreshed_token(refresh_token: str) -> str:
         raise HttpError(401, 'refresh token 已過期, 請重新登入')
     except jwt.InvalidTokenError:
         raise HttpError(401, '無效的 refresh token')
+
+
+# 撤銷 token
+def revoke_token(token: str) -> None:
+    """
+    撤銷 access 或 refresh token, 已過期或無效的 token 不需要處理
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.InvalidTokenError:
+        return
+
+    jti = payload.get('jti')
+    if jti:
+        expires_at = datetime.fromtimestamp(payload['exp'], tz=timezone.utc)
+        TokenRevocation.revoke(jti, expires_at)
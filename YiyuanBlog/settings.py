@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 from celery.schedules import crontab
@@ -103,6 +104,89 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_RESULT_EXPIRES = 3600
 CELERY_TIMEZONE = 'Asia/Taipei'
 
+# redis 設定, 瀏覽數等跨 worker 共用的計數器
+REDIS_URL = 'redis://localhost:6379/2'
+
+# 文章瀏覽數寫回資料庫的間隔(秒)
+VIEW_COUNT_FLUSH_INTERVAL = 30
+
+# 快取設定, 本機沒有 redis 時可改用 django.core.cache.backends.locmem.LocMemCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/3',
+    }
+}
+
+# 單篇文章內容快取時間(秒)
+POST_DETAIL_CACHE_TIMEOUT = 60 * 60
+
+# 增量自動儲存
+AUTOSAVE_COMPACT_STEPS = 50  # 累積多少個 step 就立即壓縮
+AUTOSAVE_COMPACT_IDLE_SECONDS = 60 * 5  # 草稿閒置多久後由定時任務壓縮
+AUTOSAVE_DRAFT_CACHE_TIMEOUT = 60 * 30  # 草稿內容快取時間(秒)
+
+# 整份文件自動儲存的緩衝, 每篇文章每 N 秒最多寫入資料庫一次
+DRAFT_FLUSH_INTERVAL = 10
+
+# 標籤自動完成索引定期重建的間隔(秒), 修正使用次數減少後的排序
+TAG_SUGGEST_REBUILD_SECONDS = 60 * 10
+
+# 首頁精選候選池: 每個可見性分類保留的文章數, 重新計算的間隔(秒)
+HIGHLIGHT_POOL_SIZE = 1000
+HIGHLIGHT_POOL_REFRESH_INTERVAL = 60 * 5
+# 定時任務停止時, 過期後由請求重新建立
+HIGHLIGHT_POOL_TIMEOUT = HIGHLIGHT_POOL_REFRESH_INTERVAL * 3
+
+# 使用者追蹤名單快取: 共用快取時間(秒), process 內 LRU 的存活時間(秒)與數量
+FOLLOW_CACHE_TIMEOUT = 60 * 10
+FOLLOW_CACHE_LOCAL_TTL = 10
+FOLLOW_CACHE_LOCAL_SIZE = 10000
+
+# 認證用的使用者快取: 共用快取時間(秒), process 內 LRU 的存活時間(秒)與數量
+USER_CACHE_TIMEOUT = 60 * 10
+USER_CACHE_LOCAL_TTL = 10
+USER_CACHE_LOCAL_SIZE = 10000
+
+# token 撤銷: 各 process 檢查撤銷名單版本的間隔(秒), Bloom filter 的預設容量
+TOKEN_REVOCATION_SYNC_SECONDS = 2
+TOKEN_REVOCATION_BLOOM_CAPACITY = 100000
+# 完整重建 Bloom filter 的間隔(秒), 移除已到期的 jti, 其餘時間只增量同步
+TOKEN_REVOCATION_REBUILD_SECONDS = 60 * 60
+
+# 密碼雜湊執行緒池: 執行緒數(0 表示在請求的執行緒計算), 執行中加排隊的上限, 等待逾時(秒)
+# 執行緒數可以用環境變數 PASSWORD_HASH_WORKERS 覆寫, 比較效能時使用
+PASSWORD_HASH_WORKERS = int(
+    os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+)
+PASSWORD_HASH_QUEUE_LIMIT = 64
+PASSWORD_HASH_TIMEOUT = 10
+
+# 追蹤時間軸: 每個使用者保留的文章數, 閒置多久後刪除(秒)
+TIMELINE_MAX_LENGTH = 800
+TIMELINE_TIMEOUT = 60 * 60 * 24 * 30
+# 追蹤的作者都沒有文章時, 空時間軸標記的存活時間(秒)
+TIMELINE_EMPTY_TIMEOUT = 60 * 5
+# 追蹤者超過此數量的作者不推送, 改為讀取時合併
+TIMELINE_FANOUT_MAX_FOLLOWERS = 5000
+TIMELINE_FANOUT_BATCH_SIZE = 500
+
+# 熱門分數的半衰期(小時), 互動的貢獻每經過一次半衰期減半
+TRENDING_HALF_LIFE_HOURS = 24
+
+# 相似文章: 每篇文章保留的數量, 使用超過此文章數的標籤不列入相似度計算
+RELATED_POSTS_TOP_K = 10
+RELATED_POSTS_MAX_TAG_POSTS = 2000
+
+# 未登入使用者共用的首頁快取: 超過 soft TTL 由一個 worker 重建, 重建期間回傳舊資料
+ANONYMOUS_FEED_SOFT_TTL = 30
+ANONYMOUS_FEED_HARD_TTL = 60 * 5
+
+# 已登入使用者首頁的共用區段(公開與會員文章): 快取的文章數與時間(秒)
+FEED_SEGMENT_SIZE = 200
+FEED_SEGMENT_SOFT_TTL = 30
+FEED_SEGMENT_HARD_TTL = 60 * 5
+
 # beat 設定, 定時任務
 CELERY_BEAT_SCHEDULE = {
     # 測試用
@@ -115,6 +199,46 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'storage.tasks.storage_plan_check',
         'schedule': crontab(minute='*/1'),  # 測試用, 每分鐘執行一次
     },
+    # 將緩衝的文章瀏覽數批次寫回資料庫
+    'post-flush-view-counts': {
+        'task': 'post.tasks.flush_view_counts',
+        'schedule': VIEW_COUNT_FLUSH_INTERVAL,
+    },
+    # 每日凌晨4點修正文章讚數, 收藏數, 留言數
+    'post-reconcile-counters-every-day': {
+        'task': 'post.tasks.reconcile_post_counters',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    # 每日凌晨4點15分重新計算熱門分數, 修正浮點誤差並補上既有文章的分數
+    'post-rebuild-trending-scores-every-day': {
+        'task': 'post.tasks.rebuild_trending_scores',
+        'schedule': crontab(hour=4, minute=15),
+    },
+    # 每5分鐘壓縮閒置草稿的自動儲存 step
+    'post-compact-idle-drafts': {
+        'task': 'post.tasks.compact_idle_drafts',
+        'schedule': crontab(minute='*/5'),
+    },
+    # 將草稿緩衝區寫回資料庫
+    'post-flush-draft-buffers': {
+        'task': 'post.tasks.flush_draft_buffers',
+        'schedule': DRAFT_FLUSH_INTERVAL,
+    },
+    # 每日凌晨4點半重新計算相似文章
+    'post-rebuild-related-posts-every-day': {
+        'task': 'post.tasks.rebuild_related_posts',
+        'schedule': crontab(hour=4, minute=30),
+    },
+    # 重新計算首頁精選候選池
+    'core-refresh-highlight-pool': {
+        'task': 'core.tasks.refresh_highlight_pool',
+        'schedule': HIGHLIGHT_POOL_REFRESH_INTERVAL,
+    },
+    # 每日凌晨5點刪除已到期的 token 撤銷紀錄
+    'user-purge-revoked-tokens-every-day': {
+        'task': 'user.tasks.purge_revoked_tokens',
+        'schedule': crontab(hour=5, minute=0),
+    },
 }
 
 
@@ -180,3 +304,10 @@ CORS_ALLOWED_METHODS = [
     'OPTIONS',
     'HEAD',
 ]
+
+# 讓前端可以讀取條件式請求與分頁游標的標頭
+CORS_EXPOSE_HEADERS = [
+    'ETag',
+    'Last-Modified',
+    'X-Next-Cursor',
+]
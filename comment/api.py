@@ -1,16 +1,24 @@
 from typing import List
 
+from asgiref.sync import sync_to_async
 from django.db import transaction
-from django.db.models import Count
-from django.http import HttpRequest
+from django.db.models import Count, Max
+from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404
 from ninja import Router
 from ninja.errors import HttpError
 
+from post.counters import PostCounter
 from post.models import (
     Post,
 )
-from YiyuanBlog.auth import get_optional_user
+from shared.http_cache import (
+    is_not_modified,
+    make_weak_etag,
+    not_modified,
+    set_validators,
+)
+from YiyuanBlog.auth import AsyncOptionalJWTAuth, aget_optional_user
 
 from .models import Comment, Like
 from .schemas import (
@@ -26,16 +34,40 @@ router = Router()
 
 @router.get(
     path='get/{int:post_id}/',
-    response={200: List[GetCommentOut]},
+    response={200: List[GetCommentOut], 304: None},
     summary='查詢留言',
-    auth=None,
+    auth=AsyncOptionalJWTAuth(),
 )
-def get_comment(request: HttpRequest, post_id: int) -> tuple[int:List]:
+async def get_comment(
+    request: HttpRequest, response: HttpResponse, post_id: int
+) -> tuple[int:List] | HttpResponse:
     """
     查詢留言
+    - 支援 If-None-Match, 留言沒有變動時回傳 304
+    - 非同步端點, 資料庫使用 async ORM
     """
     # 可選認證, 當前登入使用者
-    user = get_optional_user(request)
+    user = await aget_optional_user(request)
+
+    # 用一次聚合查詢產生 ETag, 新增, 編輯, 刪除留言或點讚都會改變結果
+    # 刪除留言不會改變最後更新時間, 所以不提供 Last-Modified
+    stats = await Comment.objects.filter(post=post_id).aaggregate(
+        total=Count('id', distinct=True),
+        last_updated=Max('updated_at'),
+        total_likes=Count('likes', distinct=True),
+        last_like=Max('likes__id'),  # 收回讚再按讚, 總數不變但 id 會變
+    )
+    etag = make_weak_etag(
+        post_id,
+        user.id if user else None,  # is_liked 依使用者而不同
+        stats['total'],
+        stats['last_updated'].isoformat() if stats['last_updated'] else None,
+        stats['total_likes'],
+        stats['last_like'],
+    )
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
 
     top_level_comments = (
         Comment.objects.filter(
@@ -53,10 +85,17 @@ def get_comment(request: HttpRequest, post_id: int) -> tuple[int:List]:
         )
     )
 
-    return 200, [
-        GetCommentOut.from_comment_recursive(comment, user)
-        for comment in top_level_comments
-    ]
+    # async 迭代時 prefetch_related 一併執行
+    comments = [comment async for comment in top_level_comments]
+
+    # 組裝回覆樹時仍會查詢作者與點讚狀態, 在執行緒中執行
+    def build() -> list:
+        return [
+            GetCommentOut.from_comment_recursive(comment, user)
+            for comment in comments
+        ]
+
+    return 200, await sync_to_async(build)()
 
 
 @router.post(
@@ -81,13 +120,17 @@ def create_new_reply(
             post=post,
         )
 
-    # 建立留言
-    comment = Comment.objects.create(
-        post=post,
-        author=request.auth,
-        content=payload.content,
-        parent=parent_comment,
-    )
+    # 建立留言, 同時原子更新文章留言數
+    with transaction.atomic():
+        comment = Comment.objects.create(
+            post=post,
+            author=request.auth,
+            content=payload.content,
+            parent=parent_comment,
+        )
+        PostCounter.adjust(
+            post.id, 'comment_count', 1, created=[comment.created_at]
+        )
     print(f'回覆留言成功: {comment.author}')
     return 200, {
         'id': comment.id,
@@ -122,7 +165,8 @@ def edit_comment(
 
     # 更新新留言
     comment.content = payload.content
-    comment.save(update_fields=['content'])
+    # auto_now 的 updated_at 要列在 update_fields 才會寫入, 留言列表的 ETag 依賴它
+    comment.save(update_fields=['content', 'updated_at'])
     print(f'編輯留言成功:{comment.id}')
 
     return 200, {
@@ -148,8 +192,27 @@ def delete_comment(request: HttpRequest, comment_id: int) -> tuple[int, dict]:
     if comment.author != request.auth:
         raise HttpError(403, '沒有權限刪除留言')
 
-    # 刪除留言
-    comment.delete()
+    # 刪除留言, 底下的回覆會一起刪除, 依實際刪除數量更新文章留言數
+    with transaction.atomic():
+        # 刪除前取得所有回覆的建立時間, 扣回它們的熱門分數
+        created = [comment.created_at]
+        parent_ids = [comment.id]
+        while parent_ids:
+            replies = list(
+                Comment.objects.filter(parent_id__in=parent_ids).values_list(
+                    'id', 'created_at'
+                )
+            )
+            parent_ids = [reply_id for reply_id, _ in replies]
+            created.extend(created_at for _, created_at in replies)
+
+        _, deleted_by_model = comment.delete()
+        PostCounter.adjust(
+            comment.post_id,
+            'comment_count',
+            -deleted_by_model.get('comment.Comment', 0),
+            created=created,
+        )
     print('刪除留言成功')
 
     return 200, {
@@ -1,50 +1,179 @@
 from typing import List
 
-from django.http import HttpRequest
-from ninja import Router
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, HttpResponse
+from ninja import Query, Router
 
 from post.schemas import PostListOut
-from YiyuanBlog.auth import get_optional_user
+from shared.http_cache import (
+    is_not_modified,
+    make_weak_etag,
+    not_modified,
+    set_validators,
+)
+from shared.pagination import NEXT_CURSOR_HEADER
+from YiyuanBlog.auth import (
+    AsyncOptionalJWTAuth,
+    OptionalJWTAuth,
+    aget_optional_user,
+    get_optional_user,
+)
 
+from .feed_cache import AnonymousFeedCache, SegmentedFeedCache
 from .service import PostService
+from .timeline import FollowerTimeline
 
 router = Router()
 
 
+def _cached_feed_response(request: HttpRequest, entry: dict) -> HttpResponse:
+    """
+    以快取中序列化好的 JSON 回應, 不再經過 schema 序列化
+    """
+    if is_not_modified(request, entry['etag']):
+        response = not_modified(entry['etag'])
+    else:
+        response = HttpResponse(entry['content'], content_type='application/json')
+        set_validators(response, entry['etag'])
+    if entry.get('next_cursor'):
+        response[NEXT_CURSOR_HEADER] = entry['next_cursor']
+    return response
+
+
 @router.get(
     path='homepage/postlist/',
-    response=List[PostListOut],
+    response={200: List[PostListOut], 304: None},
     summary='首頁文章列表',
-    auth=None,
+    auth=AsyncOptionalJWTAuth(),
 )
-def get_homepage(request: HttpRequest) -> List[PostListOut]:
+async def get_homepage(
+    request: HttpRequest,
+    response: HttpResponse,
+    cursor: str | None = None,
+    limit: int = Query(6, ge=1, le=50),
+) -> List[PostListOut] | HttpResponse:
     """
     首頁文章列表
+    - 以游標分頁, 下一頁游標放在 X-Next-Cursor 標頭, 沒有下一頁時不回傳
+    - 支援 If-None-Match, 列表沒有變動時回傳 304
+    - 未登入使用者共用同一份快取, 已登入使用者只有個人區段需要即時查詢
+    - 非同步端點, 快取與查詢在執行緒中執行
+    """
+    # 可選認證, 當前登入使用者
+    user = await aget_optional_user(request)
+
+    if not user:
+        entry = await sync_to_async(AnonymousFeedCache.homepage)(
+            cursor=cursor, limit=limit
+        )
+        return _cached_feed_response(request, entry)
+
+    # 已登入使用者: 合併共用的會員區段與個人區段
+    posts, next_cursor = await sync_to_async(SegmentedFeedCache.homepage)(
+        user, cursor=cursor, limit=limit
+    )
+
+    # 由列表中每篇文章的版本與計數產生 ETag, 不需要先序列化
+    etag = make_weak_etag(
+        next_cursor,
+        *(
+            (
+                post['id'],
+                post['updated_at'].isoformat(),
+                post['like_count'],
+                post['bookmark_count'],
+                post['comment_count'],
+                post['author_name'],
+                post['author_avatar'],
+                post['reading_time'],
+            )
+            for post in posts
+        )
+    )
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+
+    return posts
+
+
+@router.get(
+    path='homepage/trending/',
+    response=List[PostListOut],
+    summary='首頁熱門列表',
+    auth=OptionalJWTAuth(),
+)
+def get_homepage_trending(
+    request: HttpRequest,
+    response: HttpResponse,
+    cursor: str | None = None,
+    limit: int = Query(10, ge=1, le=50),
+) -> List[PostListOut]:
+    """
+    首頁熱門列表, 依讚, 收藏, 留言與瀏覽數並隨時間衰減的分數排序
+    - 以游標分頁, 下一頁游標放在 X-Next-Cursor 標頭, 沒有下一頁時不回傳
     """
     # 可選認證, 當前登入使用者
     user = get_optional_user(request)
 
-    # 查詢文章列表, 預設是公開文章
-    posts = PostService.get_homepage_posts(user=user)
+    posts, next_cursor = PostService.get_trending_posts(
+        user=user, limit=limit, cursor=cursor
+    )
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
 
     return posts
 
 
 @router.get(
     path='homepage/highlight/',
-    response=List[PostListOut],
+    response={200: List[PostListOut], 304: None},
     summary='首頁精選列表',
-    auth=None,
+    auth=AsyncOptionalJWTAuth(),
 )
-def get_homepage_highlight(request: HttpRequest) -> List[PostListOut]:
+async def get_homepage_highlight(
+    request: HttpRequest,
+) -> List[PostListOut] | HttpResponse:
     """
     首頁精選列表
+    - 未登入使用者共用同一份快取
+    - 非同步端點, 快取與查詢在執行緒中執行
     """
 
     # 可選認證, 當前登入使用者
-    user = get_optional_user(request)
+    user = await aget_optional_user(request)
+
+    if not user:
+        entry = await sync_to_async(AnonymousFeedCache.highlight)()
+        return _cached_feed_response(request, entry)
 
     # 查詢精選文章列表, 預設是公開文章
-    posts = PostService.get_highlight_posts(user=user)
+    posts = await sync_to_async(PostService.get_highlight_posts)(user=user)
+
+    return posts
+
+
+@router.get(
+    path='timeline/',
+    response=List[PostListOut],
+    summary='追蹤作者的文章時間軸',
+)
+def get_timeline(
+    request: HttpRequest,
+    response: HttpResponse,
+    cursor: str | None = None,
+    limit: int = Query(10, ge=1, le=50),
+) -> List[PostListOut]:
+    """
+    追蹤作者的文章時間軸
+    - 以游標分頁, 下一頁游標放在 X-Next-Cursor 標頭, 沒有下一頁時不回傳
+    """
+    posts, next_cursor = FollowerTimeline.get_page(
+        request.auth, cursor=cursor, limit=limit
+    )
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
 
     return posts
@@ -0,0 +1,174 @@
+import heapq
+import json
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.contrib.auth.models import AbstractUser
+from django.db.models import Q
+from ninja.responses import NinjaJSONEncoder
+
+from post.models import Post
+from post.schemas import PostListOut
+from post.services import project_post_list
+from shared.http_cache import make_weak_etag
+from shared.pagination import decode_cursor, encode_cursor
+from shared.soft_cache import SoftTTLCache
+from user.services import FollowGraphCache
+
+from .service import PostService
+
+
+def serialize_post_list(rows: List[Dict[str, Any]]) -> bytes:
+    """
+    將文章列表序列化成 JSON, 和 ninja 回傳 List[PostListOut] 的內容相同
+    """
+    return json.dumps(
+        [PostListOut.model_validate(row).model_dump() for row in rows],
+        cls=NinjaJSONEncoder,
+    ).encode()
+
+
+class AnonymousFeedCache:
+    """
+    未登入使用者共用的首頁列表快取
+    - 所有未登入使用者看到的內容相同, 直接快取序列化後的 JSON 與 ETag
+    - 使用 SoftTTLCache, 過期時只有一個 worker 重新查詢, 其他請求回傳舊資料
+    """
+
+    _cache = SoftTTLCache(
+        'core:feed:anon',
+        soft_ttl=settings.ANONYMOUS_FEED_SOFT_TTL,
+        hard_ttl=settings.ANONYMOUS_FEED_HARD_TTL,
+    )
+
+    @staticmethod
+    def _entry(rows: List[Dict[str, Any]], next_cursor: str | None = None) -> dict:
+        content = serialize_post_list(rows)
+        return {
+            'content': content,
+            'etag': make_weak_etag(content.decode()),
+            'next_cursor': next_cursor,
+        }
+
+    @classmethod
+    def homepage(cls, cursor: str | None, limit: int) -> dict:
+        """
+        首頁文章列表, 只快取第一頁
+        - 游標由用戶端傳入, 以游標當作快取鍵會被任意字串塞滿快取
+        :return: {'content': JSON, 'etag': ETag, 'next_cursor': 下一頁游標}
+        """
+
+        def compute() -> dict:
+            posts, next_cursor = PostService.get_homepage_posts(
+                user=None, limit=limit, cursor=cursor
+            )
+            return cls._entry(posts, next_cursor)
+
+        if cursor is not None:
+            # 無效的游標在查詢時回傳 400
+            return compute()
+        return cls._cache.get_or_compute(f'homepage:{limit}', compute)
+
+    @classmethod
+    def highlight(cls, limit: int = 12) -> dict:
+        """
+        首頁精選列表, 快取期間所有未登入使用者看到同一組抽樣結果
+        """
+
+        def compute() -> dict:
+            return cls._entry(PostService.get_highlight_posts(user=None, limit=limit))
+
+        return cls._cache.get_or_compute(f'highlight:{limit}', compute)
+
+
+def _sort_key(row: Dict[str, Any]) -> tuple:
+    return row['created_at'], row['id']
+
+
+class SegmentedFeedCache:
+    """
+    已登入使用者的首頁列表, 拆成共用與個人的區段
+    - 共用區段: 公開與會員文章, 對所有會員都相同, 快取最新的 FEED_SEGMENT_SIZE 篇
+    - 個人區段: 自己的文章與追蹤作者的追蹤者限定文章, 每次請求以 keyset 查詢少量資料
+    - 兩個區段都依 (created_at, id) 排序, 請求時合併成一頁
+    - 游標超出共用區段的範圍時, 退回 PostService 直接查詢
+    """
+
+    _cache = SoftTTLCache(
+        'core:feed:segment',
+        soft_ttl=settings.FEED_SEGMENT_SOFT_TTL,
+        hard_ttl=settings.FEED_SEGMENT_HARD_TTL,
+    )
+
+    @classmethod
+    def _members_segment(cls) -> dict:
+        def compute() -> dict:
+            size = settings.FEED_SEGMENT_SIZE
+            rows = list(
+                project_post_list(
+                    Post.objects.filter(
+                        status='published', visibility__in=('public', 'members')
+                    )
+                ).order_by('-created_at', '-id')[: size + 1]
+            )
+            # complete: 已包含所有公開與會員文章
+            return {'rows': rows[:size], 'complete': len(rows) <= size}
+
+        return cls._cache.get_or_compute('members', compute)
+
+    @staticmethod
+    def _personal_segment(
+        user: AbstractUser, before: tuple | None, limit: int
+    ) -> List[Dict[str, Any]]:
+        conditions = Q(author=user)
+        following_ids = FollowGraphCache.get_following_ids(user.id)
+        if following_ids:
+            conditions |= Q(visibility='followers', author__in=following_ids)
+
+        queryset = Post.objects.filter(conditions, status='published')
+        if before is not None:
+            created_at, pk = before
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        return list(
+            project_post_list(queryset).order_by('-created_at', '-id')[:limit]
+        )
+
+    @classmethod
+    def homepage(
+        cls, user: AbstractUser, cursor: str | None, limit: int
+    ) -> tuple[List[Dict[str, Any]], str | None]:
+        """
+        已登入使用者的首頁列表, 結果與 PostService.get_homepage_posts 相同
+        :return: (文章列表, 下一頁游標)
+        """
+        before = decode_cursor(cursor) if cursor else None
+
+        segment = cls._members_segment()
+        shared = [
+            row
+            for row in segment['rows']
+            if before is None or _sort_key(row) < before
+        ]
+        if len(shared) <= limit and not segment['complete']:
+            # 這一頁超出共用區段的範圍
+            return PostService.get_homepage_posts(
+                user=user, limit=limit, cursor=cursor
+            )
+
+        personal = cls._personal_segment(user, before, limit + 1)
+        # 自己的公開文章可能同時出現在兩個區段, 以 id 去重, 保留即時查詢的個人區段
+        seen = set()
+        merged = []
+        for row in heapq.merge(personal, shared, key=_sort_key, reverse=True):
+            if row['id'] not in seen:
+                seen.add(row['id'])
+                merged.append(row)
+                if len(merged) > limit:
+                    break
+
+        if len(merged) <= limit:
+            return merged, None
+        rows = merged[:limit]
+        return rows, encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
@@ -0,0 +1,139 @@
+import random
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.contrib.auth.models import AbstractUser
+from django.db.models import F
+
+from post.models import Post
+from shared.soft_cache import SoftTTLCache
+from user.services import FollowGraphCache
+
+# 一個候選區段: (文章 id 列表, 累積權重列表)
+Segment = tuple[List[int], List[int]]
+
+
+def _segment(rows: List[Dict[str, Any]]) -> Segment:
+    return (
+        [row['id'] for row in rows],
+        list(accumulate(row['weight'] for row in rows)),
+    )
+
+
+class HighlightPool:
+    """
+    首頁精選的候選池, 由定時任務預先計算後存在快取
+    - 依可見性分類保存符合資格的文章 id, 每類最多 HIGHLIGHT_POOL_SIZE 篇
+    - followers, private 依作者分組, 請求時只取出使用者看得到的區段
+    - 依互動數加權抽樣, 成本只和抽樣數量有關, 不隨文章總數成長
+    - 快取過期時只有一個 worker 重新建立, 其他請求使用舊的候選池
+    """
+
+    _cache = SoftTTLCache(
+        'core:highlight-pool',
+        soft_ttl=settings.HIGHLIGHT_POOL_TIMEOUT,
+        hard_ttl=settings.HIGHLIGHT_POOL_TIMEOUT * 2,
+    )
+
+    @staticmethod
+    def _eligible_rows(visibility: str) -> List[Dict[str, Any]]:
+        # 沒有縮圖的文章不上精選, 互動越多權重越高
+        return list(
+            Post.objects.filter(
+                status='published',
+                thumbnail_url__isnull=False,
+                visibility=visibility,
+            )
+            .annotate(
+                weight=1 + F('like_count') + F('bookmark_count') + F('comment_count')
+            )
+            .order_by('-weight', '-created_at')
+            .values('id', 'author_id', 'weight')[: settings.HIGHLIGHT_POOL_SIZE]
+        )
+
+    @classmethod
+    def build(cls) -> Dict[str, Any]:
+        """
+        從資料庫建立候選池
+        """
+        pool: Dict[str, Any] = {}
+        for visibility in ('public', 'members'):
+            pool[visibility] = _segment(cls._eligible_rows(visibility))
+
+        for visibility in ('followers', 'private'):
+            by_author: Dict[int, List[Dict[str, Any]]] = {}
+            for row in cls._eligible_rows(visibility):
+                by_author.setdefault(row['author_id'], []).append(row)
+            pool[visibility] = {
+                author_id: _segment(rows) for author_id, rows in by_author.items()
+            }
+        return pool
+
+    @classmethod
+    def refresh(cls) -> int:
+        """
+        重新建立候選池並寫入快取
+        :return: 候選文章數量
+        """
+        pool = cls._cache.refresh('pool', cls.build)
+        return (
+            len(pool['public'][0])
+            + len(pool['members'][0])
+            + sum(len(ids) for ids, _ in pool['followers'].values())
+            + sum(len(ids) for ids, _ in pool['private'].values())
+        )
+
+    @classmethod
+    def get_pool(cls) -> Dict[str, Any]:
+        # 定時任務還沒跑過或快取被清除時, 由一個 worker 當場建立
+        return cls._cache.get_or_compute('pool', cls.build)
+
+    @classmethod
+    def _segments_for(
+        cls, pool: Dict[str, Any], user: AbstractUser | None
+    ) -> List[Segment]:
+        if not user:
+            # 未登入使用者只能看公開文章
+            return [pool['public']]
+
+        # 與 PostService._get_auth_user_conditions 相同的可見性規則
+        segments = [pool['public'], pool['members']]
+        # 加上自己的追蹤者限定文章
+        followed = FollowGraphCache.get_following_ids(user.id) | {user.id}
+        for author_id in followed & pool['followers'].keys():
+            segments.append(pool['followers'][author_id])
+        if user.id in pool['private']:
+            segments.append(pool['private'][user.id])
+        return segments
+
+    @staticmethod
+    def _weighted_sample(segments: List[Segment], k: int) -> List[int]:
+        segments = [segment for segment in segments if segment[0]]
+        size = sum(len(ids) for ids, _ in segments)
+        if size <= k:
+            ids = [post_id for segment_ids, _ in segments for post_id in segment_ids]
+            random.shuffle(ids)
+            return ids
+
+        totals = list(accumulate(cum_weights[-1] for _, cum_weights in segments))
+        picked: Dict[int, None] = {}  # dict 保留抽中的順序
+        attempts = 0
+        # 重複抽中就重抽, 限制次數避免權重極度集中時跑太久
+        while len(picked) < k and attempts < k * 10:
+            attempts += 1
+            point = random.random() * totals[-1]
+            index = bisect_right(totals, point)
+            ids, cum_weights = segments[index]
+            offset = point - (totals[index - 1] if index else 0)
+            position = min(bisect_right(cum_weights, offset), len(ids) - 1)
+            picked[ids[position]] = None
+        return list(picked)
+
+    @classmethod
+    def sample(cls, user: AbstractUser | None = None, k: int = 12) -> List[int]:
+        """
+        從使用者看得到的候選區段中加權抽出 k 篇文章 id
+        """
+        return cls._weighted_sample(cls._segments_for(cls.get_pool(), user), k)
@@ -0,0 +1,69 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from post.models import Post
+from post.services import project_post_list
+
+
+def _row_bytes(rows: list) -> int:
+    # 以 JSON 長度估計資料庫傳回應用程式的資料量
+    return sum(len(json.dumps(row, default=str, ensure_ascii=False)) for row in rows)
+
+
+class Command(BaseCommand):
+    help = '比較首頁列表載入完整 model 與欄位投影的資料量與耗時'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=6, help='每次請求的文章數')
+        parser.add_argument('--rounds', type=int, default=200, help='重複次數')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        rounds = options['rounds']
+        base = Post.objects.filter(status='published').order_by('-created_at')
+
+        # 舊的寫法: select_related('author') 載入文章與作者的所有欄位
+        full_query = base.select_related('author')[:limit]
+        post_fields = Post._meta.concrete_fields
+        full_rows = [
+            {
+                **{f.attname: getattr(post, f.attname) for f in post_fields},
+                **{
+                    f'author__{f.attname}': getattr(post.author, f.attname)
+                    for f in post.author._meta.concrete_fields
+                },
+            }
+            for post in full_query
+        ]
+        projected_rows = list(project_post_list(base)[:limit])
+
+        full_bytes = _row_bytes(full_rows)
+        projected_bytes = _row_bytes(projected_rows)
+
+        def timed(fn) -> float:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                fn()
+            return (time.perf_counter() - start) / rounds * 1000
+
+        full_ms = timed(lambda: list(base.select_related('author')[:limit]))
+        projected_ms = timed(lambda: list(project_post_list(base)[:limit]))
+
+        with CaptureQueriesContext(connection) as ctx:
+            list(project_post_list(base)[:limit])
+
+        self.stdout.write(f'文章數: {len(projected_rows)}, 重複 {rounds} 次')
+        self.stdout.write(
+            f'完整 model: {full_bytes} bytes/請求, {full_ms:.3f} ms/請求'
+        )
+        self.stdout.write(
+            f'欄位投影:   {projected_bytes} bytes/請求, {projected_ms:.3f} ms/請求'
+        )
+        if full_bytes:
+            saved = (1 - projected_bytes / full_bytes) * 100
+            self.stdout.write(self.style.SUCCESS(f'資料量減少 {saved:.1f}%'))
+        self.stdout.write(f'投影查詢 SQL: {ctx.captured_queries[0]["sql"]}')
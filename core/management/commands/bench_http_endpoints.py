@@ -0,0 +1,72 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = '對執行中的伺服器發送併發請求, 比較 WSGI 與 ASGI 的每秒請求數與延遲'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000', help='伺服器位址'
+        )
+        parser.add_argument('--post-id', type=int, default=1, help='測試用的文章 id')
+        parser.add_argument('--token', default='', help='access token, 測試需要登入的端點')
+        parser.add_argument('--requests', type=int, default=500, help='每個端點的請求數')
+        parser.add_argument('--concurrency', type=int, default=32, help='同時請求數')
+
+    def _paths(self, post_id: int, token: str) -> list[str]:
+        paths = [
+            f'/api/post/{post_id}/',
+            '/api/homepage/postlist/',
+            '/api/homepage/highlight/',
+            f'/api/comment/get/{post_id}/',
+        ]
+        if token:
+            paths.append('/api/storage/info/')
+        return paths
+
+    def _request(self, url: str, token: str) -> tuple[float, bool]:
+        request = urllib.request.Request(url)
+        if token:
+            request.add_header('Authorization', f'Bearer {token}')
+
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status < 400
+        except (urllib.error.URLError, TimeoutError):
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        token = options['token']
+        total = options['requests']
+        concurrency = options['concurrency']
+
+        self.stdout.write(f'{base_url}, 每個端點 {total} 次, 同時 {concurrency} 個請求')
+        for path in self._paths(options['post_id'], token):
+            url = base_url + path
+            self._request(url, token)  # 預熱
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(
+                    executor.map(lambda _: self._request(url, token), range(total))
+                )
+            elapsed = time.perf_counter() - start
+
+            latencies = sorted(ms for ms, _ in results)
+            failed = sum(1 for _, ok in results if not ok)
+            p50 = statistics.median(latencies)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f'{path}: {total / elapsed:.1f} req/s, '
+                f'p50 {p50:.1f} ms, p99 {p99:.1f} ms, 失敗 {failed} 次'
+            )
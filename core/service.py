@@ -1,8 +1,14 @@
+from typing import Any, Dict, List
+
 from django.contrib.auth.models import AbstractUser
-from django.db.models import Q, QuerySet
+from django.db.models import Q
 
 from post.models import Post
-from user.models import Follow
+from post.services import GetPostService, project_post_list
+from shared.pagination import keyset_paginate
+from user.services import FollowGraphCache
+
+from .highlight import HighlightPool
 
 
 class PostService:
@@ -12,15 +18,17 @@ class PostService:
 
     @staticmethod
     def get_homepage_posts(
-        user: AbstractUser | None = None, limit: int = 6
-    ) -> QuerySet[Post]:
+        user: AbstractUser | None = None, limit: int = 6, cursor: str | None = None
+    ) -> tuple[List[Dict[str, Any]], str | None]:
         """
-        獲取首頁文章列表
+        獲取首頁文章列表, 以 (created_at, id) 游標分頁
         :param user: 當前登入使用者, 如果沒有登入則為 None
         :param limit: 限制返回的文章數量
+        :param cursor: 上一頁回傳的游標, 第一頁為 None
+        :return: (文章列表, 下一頁游標)
         """
         # 基礎查詢: 只查詢公開文章
-        base_query = Post.objects.select_related('author').filter(status='published')
+        base_query = Post.objects.filter(status='published')
 
         if user:
             # 已登入使用者的文章可見性條件
@@ -33,35 +41,65 @@ class PostService:
             filtered_query = base_query.filter(visibility='public')
             print('未登入使用者, 只能看到公開文章')
 
-        return filtered_query.order_by('-created_at')[:limit]
+        # 只投影列表需要的欄位, 不載入 content
+        return keyset_paginate(project_post_list(filtered_query), cursor, limit)
+
+    @staticmethod
+    def get_trending_posts(
+        user: AbstractUser | None = None, limit: int = 10, cursor: str | None = None
+    ) -> tuple[List[Dict[str, Any]], str | None]:
+        """
+        獲取熱門文章列表, 依熱門分數排序, 以 (trending_score, id) 游標分頁
+        :param user: 當前登入使用者, 如果沒有登入則為 None
+        :param limit: 限制返回的文章數量
+        :param cursor: 上一頁回傳的游標, 第一頁為 None
+        :return: (文章列表, 下一頁游標)
+        """
+        base_query = Post.objects.filter(status='published')
+        if user:
+            filtered_query = base_query.filter(
+                PostService._get_auth_user_conditions(user)
+            )
+        else:
+            filtered_query = base_query.filter(visibility='public')
+
+        return keyset_paginate(
+            project_post_list(filtered_query, 'trending_score'),
+            cursor,
+            limit,
+            field='trending_score',
+            value_type=float,
+        )
 
     @staticmethod
     def get_highlight_posts(
         user: AbstractUser | None = None, limit: int = 12
-    ) -> QuerySet[Post]:
+    ) -> List[Dict[str, Any]]:
         """
         獲取首頁精選文章列表
+        - 從預先計算的精選候選池抽樣, 只查詢抽中的文章
         :param user: 當前登入使用者, 如果沒有登入則為 None
         :param limit: 限制返回的精選文章數量
         """
-        # 基礎查詢: 只查詢公開文章
-        #  沒有縮圖文章不要上, filter 要加權限
-        base_query = Post.objects.select_related('author').filter(
-            status='published', thumbnail_url__isnull=False
-        )
-
-        if user:
-            # 已登入使用者的文章可見性條件
-            conditions = PostService._get_auth_user_conditions(user)
-            filtered_query = base_query.filter(conditions)
-            print(f'使用者: {user} 已登入, 根據權限過濾精選文章')
+        post_ids = HighlightPool.sample(user=user, k=limit)
+        if not post_ids:
+            return []
 
-        else:
-            # 未登入使用者只能看公開文章
-            filtered_query = base_query.filter(visibility='public')
-            print('未登入使用者, 只能看到公開精選文章')
+        # 候選池可能稍微過期, 查詢時再確認一次狀態, 權限在記憶體中判斷
+        rows = GetPostService.filter_visible(
+            list(
+                project_post_list(
+                    Post.objects.filter(
+                        id__in=post_ids, status='published', thumbnail_url__isnull=False
+                    )
+                )
+            ),
+            user=user,
+        )
 
-        return filtered_query.order_by('?')[:limit]
+        # 依抽樣順序回傳
+        rows_by_id = {row['id']: row for row in rows}
+        return [rows_by_id[post_id] for post_id in post_ids if post_id in rows_by_id]
 
     @staticmethod
     def _get_auth_user_conditions(user: AbstractUser) -> Q:
@@ -74,10 +112,9 @@ class PostService:
         # 自己的文章
         conditions |= Q(author=user)
 
-        # 追蹤者可見的文章
-        followed_users = Follow.objects.filter(follower=user).values_list(
-            'following', flat=True
-        )
-        conditions |= Q(visibility='followers', author__in=followed_users)
+        # 追蹤者可見的文章, 追蹤名單從快取取得, 不需要子查詢
+        followed_users = FollowGraphCache.get_following_ids(user.id)
+        if followed_users:
+            conditions |= Q(visibility='followers', author__in=followed_users)
 
         return conditions
@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from .highlight import HighlightPool
+from .timeline import FollowerTimeline
+
+
+@shared_task
+def refresh_highlight_pool() -> str:
+    """
+    Celery定時任務, 重新計算首頁精選的候選池
+    """
+    size = HighlightPool.refresh()
+    print(f'精選候選池已更新, 共 {size} 篇文章')
+    return f'精選候選池已更新, 共 {size} 篇文章'
+
+
+@shared_task
+def fan_out_post(post_id: int) -> str:
+    """
+    Celery任務, 將發布的文章推送到追蹤者的時間軸
+    """
+    pushed = FollowerTimeline.fan_out(post_id)
+    return f'文章 {post_id} 已推送到 {pushed} 個時間軸'
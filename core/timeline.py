@@ -0,0 +1,267 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List
+
+import redis
+from django.conf import settings
+from django.contrib.auth.models import AbstractUser
+from django.db import transaction
+from django.db.models import Q
+
+from post.models import Post
+from post.services import GetPostService, project_post_list
+from shared.pagination import decode_cursor, encode_cursor
+from shared.redis_client import get_redis
+from user.models import Follow
+from user.services import FollowGraphCache
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# 時間軸上的一筆資料: (發布時間的微秒數, 文章 id)
+Entry = tuple[int, int]
+
+
+def _to_score(created_at: datetime) -> int:
+    # 以整數微秒當作分數, 在 double 的精確範圍內, 可以和游標互相轉換
+    delta = created_at - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _from_score(score: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=score)
+
+
+class FollowerTimeline:
+    """
+    追蹤作者的文章時間軸, 發布時寫入 (fan-out on write)
+    - 每個使用者一個 redis sorted set, 分數為發布時間, 最多保留 TIMELINE_MAX_LENGTH 篇
+    - 追蹤者超過 TIMELINE_FANOUT_MAX_FOLLOWERS 的作者不寫入, 讀取時再從資料庫合併
+    - 讀取時再確認文章狀態, 可見性與追蹤關係, 刪除或取消追蹤不需要清理時間軸
+    """
+
+    KEY = 'timeline:{user_id}'
+    # 追蹤的作者都沒有文章時的標記, 避免每次讀取都重建
+    EMPTY_KEY = 'timeline:{user_id}:empty'
+    # 讀取時合併的高追蹤數作者
+    CELEBRITY_KEY = 'timeline:celebrities'
+
+    @staticmethod
+    def schedule(post_id: int) -> None:
+        """
+        transaction commit 之後, 交給 celery 把文章推送到追蹤者的時間軸
+        """
+        from core.tasks import fan_out_post
+
+        transaction.on_commit(lambda: fan_out_post.delay(post_id))
+
+    @classmethod
+    def invalidate(cls, user_id: int) -> None:
+        """
+        追蹤新作者後清除時間軸, 下次讀取時從資料庫重建, 納入該作者已發布的文章
+        """
+
+        def clear() -> None:
+            try:
+                get_redis().delete(
+                    cls.KEY.format(user_id=user_id),
+                    cls.EMPTY_KEY.format(user_id=user_id),
+                )
+            except redis.RedisError as e:
+                print(f'時間軸清除失敗: {e}')
+
+        transaction.on_commit(clear)
+
+    @classmethod
+    def fan_out(cls, post_id: int) -> int:
+        """
+        把文章寫入所有追蹤者的時間軸
+        :return: 寫入的時間軸數量
+        """
+        post = (
+            Post.objects.filter(id=post_id, status='published')
+            .exclude(visibility='private')
+            .values('author_id', 'created_at')
+            .first()
+        )
+        if post is None:
+            return 0
+
+        author_id = post['author_id']
+        followers = Follow.objects.filter(following_id=author_id)
+        client = get_redis()
+        if followers.count() >= settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+            # 追蹤者太多, 改為讀取時合併, 之後也不再寫入
+            client.sadd(cls.CELEBRITY_KEY, author_id)
+            return 0
+        if client.sismember(cls.CELEBRITY_KEY, author_id):
+            return 0
+
+        score = _to_score(post['created_at'])
+        pushed = 0
+        batch: List[int] = []
+        follower_ids = followers.values_list('follower_id', flat=True)
+        for follower_id in follower_ids.iterator(chunk_size=1000):
+            batch.append(follower_id)
+            if len(batch) >= settings.TIMELINE_FANOUT_BATCH_SIZE:
+                pushed += cls._push(client, batch, post_id, score)
+                batch = []
+        if batch:
+            pushed += cls._push(client, batch, post_id, score)
+        return pushed
+
+    @classmethod
+    def _push(
+        cls, client: redis.Redis, user_ids: List[int], post_id: int, score: int
+    ) -> int:
+        keys = [cls.KEY.format(user_id=user_id) for user_id in user_ids]
+
+        # 只寫入已存在的時間軸, 不存在的在第一次讀取時從資料庫重建
+        with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.exists(key)
+            found = pipe.execute()
+        existing = [key for key, exists in zip(keys, found) if exists]
+        missing = [
+            user_id for user_id, exists in zip(user_ids, found) if not exists
+        ]
+
+        with client.pipeline(transaction=False) as pipe:
+            # 原本是空的時間軸有了新文章, 清除空標記讓下次讀取時重建
+            if missing:
+                pipe.delete(
+                    *(cls.EMPTY_KEY.format(user_id=user_id) for user_id in missing)
+                )
+            for key in existing:
+                pipe.zadd(key, {post_id: score})
+                pipe.zremrangebyrank(key, 0, -settings.TIMELINE_MAX_LENGTH - 1)
+                pipe.expire(key, settings.TIMELINE_TIMEOUT)
+            pipe.execute()
+        return len(existing)
+
+    @staticmethod
+    def _from_database(
+        author_ids: Iterable[int], before: Entry | None, limit: int
+    ) -> List[Entry]:
+        queryset = Post.objects.filter(
+            author_id__in=list(author_ids), status='published'
+        ).exclude(visibility='private')
+        if before is not None:
+            created_at, post_id = _from_score(before[0]), before[1]
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id)
+            )
+        rows = queryset.order_by('-created_at', '-id').values_list(
+            'created_at', 'id'
+        )[:limit]
+        return [(_to_score(created_at), post_id) for created_at, post_id in rows]
+
+    @classmethod
+    def _rebuild(
+        cls, client: redis.Redis, user_id: int, author_ids: Iterable[int]
+    ) -> None:
+        entries = cls._from_database(author_ids, None, settings.TIMELINE_MAX_LENGTH)
+        if not entries:
+            # sorted set 不能是空的, 另外寫入空標記
+            client.set(
+                cls.EMPTY_KEY.format(user_id=user_id),
+                1,
+                ex=settings.TIMELINE_EMPTY_TIMEOUT,
+            )
+            return
+        key = cls.KEY.format(user_id=user_id)
+        with client.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.zadd(key, {post_id: score for score, post_id in entries})
+            pipe.expire(key, settings.TIMELINE_TIMEOUT)
+            pipe.execute()
+
+    @classmethod
+    def _from_redis(
+        cls,
+        client: redis.Redis,
+        user_id: int,
+        author_ids: Iterable[int],
+        before: Entry | None,
+        limit: int,
+    ) -> List[Entry]:
+        key = cls.KEY.format(user_id=user_id)
+        if not client.exists(key):
+            if client.exists(cls.EMPTY_KEY.format(user_id=user_id)):
+                return []
+            cls._rebuild(client, user_id, author_ids)
+
+        max_score = before[0] if before else '+inf'
+        # 同一微秒可能有多篇文章, 多讀幾筆再依 id 排除已讀過的
+        rows = client.zrevrangebyscore(
+            key, max_score, '-inf', start=0, num=limit + 5, withscores=True
+        )
+        entries = [(int(score), int(post_id)) for post_id, score in rows]
+        if before is not None:
+            entries = [entry for entry in entries if entry < before]
+        return entries[:limit]
+
+    @classmethod
+    def get_page(
+        cls, user: AbstractUser, cursor: str | None = None, limit: int = 10
+    ) -> tuple[List[Dict[str, Any]], str | None]:
+        """
+        讀取時間軸的一頁, 以 (created_at, id) 游標分頁
+        :return: (文章列表, 下一頁游標)
+        """
+        following_ids = FollowGraphCache.get_following_ids(user.id)
+        if not following_ids:
+            return [], None
+
+        before = None
+        if cursor:
+            created_at, post_id = decode_cursor(cursor)
+            before = (_to_score(created_at), post_id)
+
+        # 被過濾掉的文章需要補位, 多取一些候選
+        fetch = limit * 2 + 1
+        try:
+            client = get_redis()
+            celebrities = {
+                int(author_id) for author_id in client.smembers(cls.CELEBRITY_KEY)
+            }
+            merged_authors = following_ids & celebrities
+            entries = cls._from_redis(
+                client, user.id, following_ids - celebrities, before, fetch
+            )
+            if merged_authors:
+                entries += cls._from_database(merged_authors, before, fetch)
+        except redis.RedisError as e:
+            # redis 無法使用時, 退回讀取時從資料庫合併
+            print(f'時間軸讀取失敗, 改從資料庫查詢: {e}')
+            entries = cls._from_database(following_ids, before, fetch)
+
+        # 合併後依時間排序, 同一篇文章可能同時出現在兩個來源
+        entries = sorted(set(entries), reverse=True)[:fetch]
+        if not entries:
+            return [], None
+
+        rows = project_post_list(
+            Post.objects.filter(
+                id__in=[post_id for _, post_id in entries], status='published'
+            )
+        )
+        visible = {
+            row['id']: row
+            for row in GetPostService.filter_visible(list(rows), user=user)
+            if row['author_id'] in following_ids
+        }
+
+        posts: List[Dict[str, Any]] = []
+        last_entry = None
+        for entry in entries:
+            if len(posts) == limit:
+                break
+            last_entry = entry
+            if entry[1] in visible:
+                posts.append(visible[entry[1]])
+
+        # 候選還沒用完, 或候選數量達到上限代表後面還有資料
+        has_more = last_entry != entries[-1] or len(entries) == fetch
+        next_cursor = None
+        if has_more and last_entry is not None:
+            next_cursor = encode_cursor(_from_score(last_entry[0]), last_entry[1])
+        return posts, next_cursor
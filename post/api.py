@@ -1,38 +1,64 @@
+from typing import List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.db import transaction
-from django.db.models import Count, Prefetch
-from django.http import HttpRequest
+from django.db.models import Count
+from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404
-from ninja import File, Router, UploadedFile
+from ninja import File, Query, Router, UploadedFile
 from ninja.errors import HttpError
 
+from core.timeline import FollowerTimeline
+from post.autosave import DraftAutosaveService
+from post.cache import PostDetailCache
+from post.counters import PostCounter, ViewCounter
+from post.draft_buffer import DraftWriteBuffer
 from post.models import (
     Bookmark,
     Post,
     PostImage,
     PostVideo,
-    TagManagement,
 )
+from post.related import RelatedPostIndex
 from post.schemas import (
     BookmarkToggleOut,
     GetPostDetailOut,
     LikeStatusOut,
+    PostDraftOut,
+    PostListOut,
+    TagSuggestOut,
     UpdatePostContentIn,
+    UpdatePostStepsIn,
     UpdatePostTagIn,
     _AuthorInfo,
 )
+from post.search import SearchIndexer
 from post.services import ProseMirrorContentExtrator
+from post.tag_index import TagSuggestIndex
+from post.trending import TrendingScore
 from post.utils import (
     update_post_tags,
 )
+from shared.http_cache import (
+    is_not_modified,
+    make_weak_etag,
+    not_modified,
+    set_validators,
+)
 from shared.images_utils import (
     is_valid_image,
     is_valid_video,
     rename_file,
 )
 from storage.services import StorageService
-from user.models import Follow
-from YiyuanBlog.auth import get_optional_user
+from YiyuanBlog.auth import (
+    AsyncOptionalJWTAuth,
+    OptionalJWTAuth,
+    aget_optional_user,
+    get_optional_user,
+)
 
 from .services import GetPostService
 
@@ -41,69 +67,157 @@ router = Router()
 
 @router.get(
     path='{int:post_id}/',
-    response=GetPostDetailOut,
+    response={200: GetPostDetailOut, 304: None},
     summary='查詢單篇文章內容',
-    auth=None,
+    auth=AsyncOptionalJWTAuth(),
 )
-def get_post_detail(request: HttpRequest, post_id: int) -> GetPostDetailOut:
+async def get_post_detail(
+    request: HttpRequest, response: HttpResponse, post_id: int
+) -> GetPostDetailOut | HttpResponse:
     """
     查詢單篇文章內容
+    - 支援 If-None-Match / If-Modified-Since, 內容沒變時回傳 304
+    - 非同步端點, 資料庫使用 async ORM, redis 快取在執行緒中讀寫
     """
     # 可選認證, 當前登入使用者
-    user = get_optional_user(request)
+    user = await aget_optional_user(request)
 
-    # 使用 select_related 和 prefetch_related 優化查詢
+    # 先取得內容版本, 再查詢文章, 避免把舊內容寫進新版本的快取
+    version = await sync_to_async(PostDetailCache.get_version)(post_id)
+
+    # 一次查詢取得可見性, 作者, 計數, 標籤與讀者的追蹤關係, 不載入標題與內容
     try:
-        post = (
-            Post.objects.select_related('author')
-            .prefetch_related(
-                'tags',
-                'likes',
-                Prefetch(
-                    'tagmanagement_set',
-                    queryset=TagManagement.objects.select_related('tag'),
-                ),
-            )
-            .get(id=post_id, status='published')
+        post = await GetPostService.get_detail_queryset(user=user).aget(
+            id=post_id, status='published'
         )
     except Post.DoesNotExist:
         raise HttpError(404, '文章不存在或尚未發布')
 
     # 檢查文章可見性權限
-    if not GetPostService._check_post_visibility(post, user=user):
+    if not GetPostService._check_post_visibility(
+        post, user=user, is_following=post.is_following
+    ):
         raise HttpError(404, '無權限查看此文章')
 
-    # 增加瀏覽次數
-    post.views_count += 1
-    post.save(update_fields=['views_count'])
-
-    # 計算作者的追蹤者數量
-    followers_count = Follow.objects.filter(following=post.author).count()
+    # 增加瀏覽次數, 先累加在緩衝區, 由定時任務批次寫回資料庫
+    pending_views = await sync_to_async(ViewCounter.incr)(post.id)
+
+    # 弱 ETag 不含瀏覽數, 內容版本與其他計數不變就視為相同
+    etag = make_weak_etag(
+        post.id,
+        version,
+        post.updated_at.isoformat(),
+        post.author.username,
+        post.author.avatar,
+        post.followers_count,
+        post.like_count,
+        post.bookmark_count,
+        post.comment_count,
+    )
+    if is_not_modified(request, etag, post.updated_at):
+        return not_modified(etag, post.updated_at)
+    set_validators(response, etag, post.updated_at)
 
-    # 計算文章案讚數
-    like_count = post.likes.count()
+    # 讀取與讀者無關的文章內容, 快取未命中時才載入 content
+    body = await sync_to_async(PostDetailCache.get)(post_id, version)
+    if body is None:
+        body = await Post.objects.values('title', 'content').aget(id=post.id)
+        await sync_to_async(PostDetailCache.set)(post_id, version, body)
 
-    # 取得文章標籤
-    tags = [tag_mgmt.tag.name for tag_mgmt in post.tagmanagement_set.all()]
+    # 非 PostgreSQL 時標籤需要另外查詢
+    tag_names = await sync_to_async(GetPostService.get_tag_names)(post)
 
-    # 組裝回應資料
+    # 組裝回應資料, 即時的作者與計數覆蓋在快取內容上
     return GetPostDetailOut(
+        **body,
         id=post.id,
         updated_at=post.updated_at,
-        title=post.title,
-        content=post.content,
+        tags=tag_names,
         author=_AuthorInfo(
             id=post.author.id,
             username=post.author.username,
             avatar_url=post.author.avatar.url if post.author.avatar else None,
         ),
-        followers=followers_count,
-        tags=tags,
-        like_count=like_count,
-        views_count=post.views_count,
+        followers=post.followers_count,
+        like_count=post.like_count,
+        bookmark_count=post.bookmark_count,
+        comment_count=post.comment_count,
+        views_count=post.views_count + pending_views,
+        outline=post.content_meta.get('outline', []),
+        word_count=post.content_meta.get('word_count', 0),
+        reading_time=post.content_meta.get('reading_time', 0),
     )
 
 
+@router.get(
+    path='search/',
+    response=List[PostListOut],
+    summary='搜尋文章',
+    auth=OptionalJWTAuth(),
+)
+def search_posts(
+    request: HttpRequest,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    offset: int = Query(0, ge=0),
+) -> List[PostListOut]:
+    """
+    全文檢索已發布的文章
+    - 中文以二元組切詞, 搜尋標題, 摘要與內文
+    - 依相關度排序, 只回傳當前使用者可以看到的文章
+    """
+    # 可選認證, 當前登入使用者
+    user = get_optional_user(request)
+
+    return SearchIndexer.search(q, user=user, limit=limit, offset=offset)
+
+
+@router.get(
+    path='{int:post_id}/related/',
+    response=List[PostListOut],
+    summary='相似文章',
+    auth=OptionalJWTAuth(),
+)
+def get_related_posts(
+    request: HttpRequest,
+    post_id: int,
+    limit: int = Query(6, ge=1, le=settings.RELATED_POSTS_TOP_K),
+) -> List[PostListOut]:
+    """
+    依標籤共現預先計算的相似文章
+    - 只回傳當前使用者可以看到的文章
+    """
+    # 可選認證, 當前登入使用者
+    user = get_optional_user(request)
+
+    # 看不到原文章時, 也不透露它的相似文章
+    post = Post.objects.filter(id=post_id, status='published').values(
+        'visibility', 'author_id'
+    )
+    if not GetPostService.filter_visible(list(post), user=user):
+        raise HttpError(404, '文章不存在或尚未發布')
+
+    return RelatedPostIndex.get_related(post_id, user=user, limit=limit)
+
+
+@router.get(
+    path='tags/suggest/',
+    response=List[TagSuggestOut],
+    summary='標籤自動完成',
+    auth=None,
+)
+def suggest_tags(
+    request: HttpRequest,
+    q: str = Query(..., min_length=1, max_length=50),
+    limit: int = Query(10, ge=1, le=20),
+) -> List[TagSuggestOut]:
+    """
+    依前綴查詢已存在的標籤, 使用次數高的排前面
+    - 查詢記憶體中的前綴索引, 不會對資料庫做 LIKE 查詢
+    """
+    return TagSuggestIndex.suggest(q, limit=limit)
+
+
 @router.post(
     path='create/',
     response={201: dict},
@@ -125,6 +239,32 @@ def create_post(request: HttpRequest) -> tuple[int, dict]:
     return 201, {'status': 'success', 'post_id': post.id}
 
 
+@router.get(
+    path='draft/{int:post_id}/',
+    response=PostDraftOut,
+    summary='取得草稿內容',
+)
+def get_post_draft(request: HttpRequest, post_id: int) -> PostDraftOut:
+    """
+    取得作者自己的最新草稿內容與版本, 編輯器載入時使用
+    """
+    post = get_object_or_404(Post, id=post_id)
+
+    # 權限檢查
+    if post.author != request.auth:
+        raise HttpError(403, '無權限查看此草稿')
+
+    # 緩衝區尚未寫回資料庫的版本也要看得到
+    draft = DraftWriteBuffer.get(post)
+    return PostDraftOut(
+        id=post.id,
+        title=draft['title'],
+        content=draft['content'],
+        version=draft['version'],
+        status=post.status,
+    )
+
+
 @router.patch(
     path='update/{int:post_id}/',
     response={200: dict},
@@ -134,7 +274,8 @@ def upload_post(
     request: HttpRequest, post_id: int, payload: UpdatePostContentIn
 ) -> tuple[int, dict]:
     """
-    即時更新文章
+    即時更新文章, 整份文件覆蓋
+    - 先寫入緩衝區, 每篇文章每 DRAFT_FLUSH_INTERVAL 秒最多寫入資料庫一次
     """
 
     # 取得指定文章
@@ -147,16 +288,66 @@ def upload_post(
     if post.author != request.auth:
         raise HttpError(403, '無權限修改此文章')
 
-    # 更新文章
-    # 迭代 payload 的屬性, 將其值設置到 post 物件上
-    for attr, value in payload.dict().items():
-        setattr(post, attr, value)
-    post.save()
-    print(f'文章及時更新成功: {post.title}')
+    # 有帶版本的話, 確認用戶端不是拿舊的文件覆蓋
+    data = payload.dict(exclude_unset=True)
+    draft = DraftWriteBuffer.get(post)
+    base_version = data.get('version')
+    if base_version is not None and base_version != draft['version']:
+        raise HttpError(409, f'草稿版本已過期, 目前版本: {draft["version"]}')
+
+    # 沒有傳入的欄位沿用目前的草稿
+    title = data.get('title')
+    content = data.get('content')
+    version = DraftWriteBuffer.save(
+        post,
+        title=title if title is not None else draft['title'],
+        content=content if content is not None else draft['content'],
+    )
+
+    return 200, {
+        'status': 'success',
+        'post_id': post.id,
+        'version': version,
+    }
+
+
+@router.patch(
+    path='update/{int:post_id}/steps/',
+    response={200: dict},
+    summary='增量更新文章',
+)
+def upload_post_steps(
+    request: HttpRequest, post_id: int, payload: UpdatePostStepsIn
+) -> tuple[int, dict]:
+    """
+    增量更新文章, 只送出 JSON Patch 操作
+    - version 必須是目前的草稿版本, 否則回傳 409
+    """
+    post = get_object_or_404(Post, id=post_id)
+
+    # 權限檢查
+    if post.author != request.auth:
+        raise HttpError(403, '無權限修改此文章')
+
+    # 緩衝區有整份文件的修改時, 先寫回資料庫再套用增量修改
+    if DraftWriteBuffer.flush(post.id):
+        post.refresh_from_db()
+
+    version = DraftAutosaveService.apply_steps(
+        post, payload.version, payload.operations
+    )
+
+    # 標題很小, 直接更新欄位
+    if payload.title is not None and payload.title != post.title:
+        Post.objects.filter(id=post.id).update(title=payload.title)
+        PostDetailCache.invalidate(post.id)
+        if post.status == 'published':
+            SearchIndexer.schedule(post.id)
 
     return 200, {
         'status': 'success',
         'post_id': post.id,
+        'version': version,
     }
 
 
@@ -178,26 +369,51 @@ def post_article(
     if post.author != request.auth:
         raise HttpError(403, '無權限修改此文章')
 
+    # 先把緩衝區與增量自動儲存的修改寫回 content
+    flushed = DraftWriteBuffer.flush(post.id)
+    if DraftAutosaveService.compact(post.id) or flushed:
+        post.refresh_from_db()
+
     # 標籤不為空的話, 更新文章標籤
+    tags_changed = False
     if payload.tags is not None:
-        update_post_tags(post, payload.tags)
+        added, removed = update_post_tags(post, payload.tags)
+        tags_changed = bool(added or removed)
 
     # 傳入 visibility, 設定文章可見權限
     if payload.visibility is not None:
         post.visibility = payload.visibility
 
     # 更改文章狀態為已發布
+    first_publish = post.status != 'published'
     post.status = 'published'
 
-    # 產生文章摘要和縮圖
+    # 一次遍歷內容, 產生文章摘要, 縮圖與衍生資料
     if post.content is not None:
-        extracted_summary = ProseMirrorContentExtrator.extract_plain_text(post.content)
-        extracted_thumnail_url = ProseMirrorContentExtrator.extract_first_image_url(
-            post.content
-        )
-        post.summery = extracted_summary[:200]  # 限制摘要長度為 200 字
-        post.thumbnail_url = extracted_thumnail_url
-    post.save()
+        analysis = ProseMirrorContentExtrator.analyze(post.content)
+        post.summery = analysis['plain_text'][:200]  # 限制摘要長度為 200 字
+        post.thumbnail_url = analysis['first_image']
+        post.content_meta = ProseMirrorContentExtrator.build_content_meta(analysis)
+    # 只寫入這裡修改的欄位, 計數與熱門分數由其他請求以 F() 更新, 不能用記憶體中的值覆蓋
+    post.save(
+        update_fields=[
+            'visibility',
+            'status',
+            'summery',
+            'thumbnail_url',
+            'content_meta',
+            'updated_at',
+        ]
+    )
+    # 第一次發布給予基礎熱門分數
+    if first_publish:
+        TrendingScore.publish(post.id)
+    # 標籤變動或第一次發布, 重新計算相似文章
+    if tags_changed or first_publish:
+        RelatedPostIndex.schedule(post.id)
+    PostDetailCache.invalidate(post.id)
+    SearchIndexer.schedule(post.id)
+    FollowerTimeline.schedule(post.id)
 
     print(f'文章發布成功: {post.title}')
 
@@ -341,15 +557,19 @@ def toggle_post_like(request: HttpRequest, post_id: int) -> tuple[int, LikeStatu
         if created:
             # 新增點讚
             is_liked = True
+            delta = 1
             print(f'{user.username}點讚')
         else:
-            # 取消讚
-            like_obj.delete()
+            # 取消讚, 同時有兩個請求取消時只有一個會真的刪除
+            deleted, _ = like_obj.delete()
             is_liked = False
+            delta = -deleted
             print(f'{user.username}收回讚')
 
-        # 重新計算總讚數
-        total_likes = post.likes.count()
+        # 原子更新總讚數
+        total_likes = PostCounter.adjust(
+            post.id, 'like_count', delta, created=[like_obj.created_at]
+        )
         print(f'總讚數: {total_likes}')
 
     return 200, {
@@ -375,6 +595,9 @@ def delete_post(request: HttpRequest, post_id: int) -> tuple[int, dict]:
 
     # 刪除文章
     post.delete()
+    DraftWriteBuffer.discard(post_id)
+    SearchIndexer.schedule(post_id)
+    PostDetailCache.invalidate(post_id)
     print(f'文章已刪除: {post.title}')
 
     return 200, {'status': 'success'}
@@ -404,15 +627,19 @@ def toggle_bookmark(request: HttpRequest, post_id: int) -> BookmarkToggleOut:
         if created:
             # 收藏文章
             is_bookmarked = True
+            delta = 1
             print(f'使用者 {user.username} 收藏了文章: {post.title}')
         else:
             # 取消收藏文章
-            bookmark_obj.delete()
+            deleted, _ = bookmark_obj.delete()
             is_bookmarked = False
+            delta = -deleted
             print(f'使用者 {user.username} 取消收藏了文章: {post.title}')
 
-        # 重新計算收藏數
-        bookmark_count = post.bookmarked_by.count()
+        # 原子更新收藏數
+        bookmark_count = PostCounter.adjust(
+            post.id, 'bookmark_count', delta, created=[bookmark_obj.created_at]
+        )
 
     return {
         'is_bookmarked': is_bookmarked,
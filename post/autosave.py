@@ -0,0 +1,118 @@
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from ninja.errors import HttpError
+
+from post.cache import PostDetailCache
+from post.json_patch import JsonPatchError, apply_patch
+from post.models import Post, PostContentStep
+from post.search import SearchIndexer
+
+
+class DraftAutosaveService:
+    """
+    增量自動儲存
+    - 編輯器只送出 JSON Patch 操作與目前的草稿版本, 伺服器只寫入一筆小的 step
+    - 版本不符代表用戶端的文件已過期, 回傳 409 讓編輯器重新同步
+    - 累積的 step 定期壓縮回 Post.content, 讓資料庫保存完整的文件
+    """
+
+    DRAFT_KEY = 'post:draft:{post_id}:v{version}'
+
+    @staticmethod
+    def _cache_draft(post_id: int, version: int, content: Dict[str, Any]) -> None:
+        key = DraftAutosaveService.DRAFT_KEY.format(post_id=post_id, version=version)
+        cache.set(key, content, timeout=settings.AUTOSAVE_DRAFT_CACHE_TIMEOUT)
+
+    @staticmethod
+    def get_draft(post: Post) -> Dict[str, Any]:
+        """
+        取得最新版本的草稿內容 (content 加上尚未壓縮的 step)
+        """
+        if post.draft_version == post.content_version:
+            return post.content
+
+        key = DraftAutosaveService.DRAFT_KEY.format(
+            post_id=post.id, version=post.draft_version
+        )
+        content = cache.get(key)
+        if content is not None:
+            return content
+
+        content = post.content
+        steps = PostContentStep.objects.filter(
+            post=post,
+            version__gt=post.content_version,
+            version__lte=post.draft_version,
+        ).values_list('operations', flat=True)
+        for operations in steps:
+            content = apply_patch(content, operations)
+
+        DraftAutosaveService._cache_draft(post.id, post.draft_version, content)
+        return content
+
+    @staticmethod
+    def apply_steps(
+        post: Post, base_version: int, operations: List[Dict[str, Any]]
+    ) -> int:
+        """
+        將 JSON Patch 套用到草稿, 回傳新的草稿版本
+        :param base_version: 用戶端目前的草稿版本
+        """
+        if base_version != post.draft_version:
+            raise HttpError(409, f'草稿版本已過期, 目前版本: {post.draft_version}')
+
+        try:
+            content = apply_patch(DraftAutosaveService.get_draft(post), operations)
+        except JsonPatchError as e:
+            raise HttpError(422, f'無法套用修改: {e}')
+
+        new_version = base_version + 1
+        with transaction.atomic():
+            # 樂觀鎖, 同時有兩個請求時只有一個會成功
+            updated = Post.objects.filter(
+                id=post.id, draft_version=base_version
+            ).update(draft_version=new_version)
+            if not updated:
+                raise HttpError(409, '草稿版本已過期, 請重新載入')
+            PostContentStep.objects.create(
+                post=post, version=new_version, operations=operations
+            )
+
+        post.draft_version = new_version
+        DraftAutosaveService._cache_draft(post.id, new_version, content)
+
+        # step 太多時提早壓縮, 避免讀取草稿時要套用太多次
+        if new_version - post.content_version >= settings.AUTOSAVE_COMPACT_STEPS:
+            from post.tasks import compact_post_content
+
+            transaction.on_commit(lambda: compact_post_content.delay(post.id))
+
+        return new_version
+
+    @staticmethod
+    def compact(post_id: int) -> bool:
+        """
+        將尚未壓縮的 step 寫回 Post.content
+        :return: 是否有壓縮
+        """
+        with transaction.atomic():
+            post = Post.objects.select_for_update().get(id=post_id)
+            if post.draft_version == post.content_version:
+                return False
+
+            post.content = DraftAutosaveService.get_draft(post)
+            post.content_version = post.draft_version
+            post.save(update_fields=['content', 'content_version', 'updated_at'])
+            PostContentStep.objects.filter(
+                post=post, version__lte=post.content_version
+            ).delete()
+
+            # 已發布的文章, 讀者看到的內容與檢索索引也要更新
+            if post.status == 'published':
+                PostDetailCache.invalidate(post.id)
+                SearchIndexer.schedule(post.id)
+
+        return True
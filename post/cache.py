@@ -0,0 +1,71 @@
+import time
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class PostDetailCache:
+    """
+    單篇文章內容的版本化快取
+    - 快取 key 帶有文章的內容版本, 修改文章時只要遞增版本, 舊的快取自然失效
+    - 只快取與讀者無關的內容(標題, 內容), 標籤, 可見性與計數由每次的文章查詢取得
+    - 內容版本也是文章 ETag 的一部分, 標籤改名時遞增版本讓用戶端重新取得
+    - 只使用 get/set/add/incr, locmem 與 redis 快取都適用
+    """
+
+    VERSION_KEY = 'post:detail:version:{post_id}'
+    BODY_KEY = 'post:detail:{post_id}:v{version}'
+
+    @staticmethod
+    def _new_version() -> int:
+        # 版本 key 被清除後重新產生的版本, 必須大於任何舊版本
+        return time.time_ns() // 1000
+
+    @staticmethod
+    def get_version(post_id: int) -> int:
+        """
+        取得文章目前的內容版本
+        """
+        key = PostDetailCache.VERSION_KEY.format(post_id=post_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, PostDetailCache._new_version(), timeout=None)
+            version = cache.get(key, PostDetailCache._new_version())
+        return version
+
+    @staticmethod
+    def get(post_id: int, version: int) -> Dict[str, Any] | None:
+        """
+        讀取快取的文章內容, 沒有快取時回傳 None
+        """
+        key = PostDetailCache.BODY_KEY.format(post_id=post_id, version=version)
+        return cache.get(key)
+
+    @staticmethod
+    def set(post_id: int, version: int, body: Dict[str, Any]) -> None:
+        """
+        寫入文章內容快取
+        :param version: 讀取文章前取得的版本, 避免把舊內容寫到新版本底下
+        """
+        key = PostDetailCache.BODY_KEY.format(post_id=post_id, version=version)
+        cache.set(key, body, timeout=settings.POST_DETAIL_CACHE_TIMEOUT)
+
+    @staticmethod
+    def invalidate(*post_ids: int) -> None:
+        """
+        遞增文章內容版本, 讓舊的快取失效
+        - 在 transaction 內呼叫時, 會等到 commit 之後才執行
+        """
+
+        def bump() -> None:
+            for post_id in post_ids:
+                key = PostDetailCache.VERSION_KEY.format(post_id=post_id)
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    # 版本 key 不存在, 直接給一個新的版本
+                    cache.set(key, PostDetailCache._new_version(), timeout=None)
+
+        transaction.on_commit(bump)
@@ -0,0 +1,232 @@
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Sequence
+
+import redis
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    FloatField,
+    OuterRef,
+    PositiveIntegerField,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from comment.models import Comment
+from post.models import Bookmark, Like, Post, ViewCountFlush
+from post.trending import WEIGHTS, TrendingScore
+from shared.redis_client import get_redis
+
+# 每次 UPDATE 最多處理的文章數, 避免 CASE WHEN 過長
+FLUSH_BATCH_SIZE = 500
+# 寫回瀏覽數的鎖期限(秒), 每寫入一批就重新計算
+FLUSH_LOCK_TIMEOUT = 60
+# 已寫回批次紀錄的保留時間, 超過後不會再有相同 id 的重試
+FLUSH_RECORD_RETENTION = timedelta(days=1)
+
+
+class ViewCounter:
+    """
+    文章瀏覽數的 write-behind 緩衝
+    - 每次瀏覽只在 redis hash 累加, 不直接寫入資料庫
+    - 由 celery 定時任務批次寫回 Post.views_count
+    """
+
+    PENDING_KEY = 'post:views:pending'  # 累加中的瀏覽數
+    FLUSHING_KEY = 'post:views:flushing'  # 寫回中的瀏覽數
+    FLUSH_ID_FIELD = 'flush_id'  # flushing 中記錄批次 id 的欄位
+    LOCK_KEY = 'post:views:flush-lock'
+
+    @staticmethod
+    def incr(post_id: int) -> int:
+        """
+        累加一次瀏覽
+        :return: 尚未寫回資料庫的瀏覽數, 讀取端加上資料庫的值就是即時總數
+        """
+        client = get_redis()
+        try:
+            with client.pipeline() as pipe:
+                pipe.hincrby(ViewCounter.PENDING_KEY, post_id, 1)
+                pipe.hget(ViewCounter.FLUSHING_KEY, post_id)
+                pending, flushing = pipe.execute()
+        except redis.RedisError as e:
+            # redis 無法使用時, 退回直接更新資料庫
+            print(f'瀏覽數緩衝失敗, 直接寫入資料庫: {e}')
+            Post.objects.filter(id=post_id).update(views_count=F('views_count') + 1)
+            return 1
+
+        return int(pending) + int(flushing or 0)
+
+    @staticmethod
+    def flush() -> dict[int, int]:
+        """
+        將緩衝的瀏覽數批次寫回資料庫
+        - 先把 pending hash 改名為 flushing, 之後的瀏覽會累加到新的 pending
+        - 上次寫回失敗留下的 flushing 會優先處理, 不會被覆蓋
+        - flushing 帶有批次 id, 和瀏覽數在同一個 transaction 寫入 ViewCountFlush,
+          commit 後沒刪掉 flushing 或鎖過期讓其他 worker 重複處理時, 不會重複累加
+        :return: {post_id: 寫回的瀏覽數}
+        """
+        client = get_redis()
+        lock = client.lock(ViewCounter.LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            # 其他 worker 正在寫回
+            return {}
+
+        try:
+            if not client.exists(ViewCounter.FLUSHING_KEY):
+                try:
+                    client.rename(ViewCounter.PENDING_KEY, ViewCounter.FLUSHING_KEY)
+                except redis.ResponseError:
+                    # 沒有任何待寫回的瀏覽數
+                    return {}
+            # 改名後才給批次 id, 重試時沿用同一個 id
+            client.hsetnx(
+                ViewCounter.FLUSHING_KEY, ViewCounter.FLUSH_ID_FIELD, uuid.uuid4().hex
+            )
+
+            data = client.hgetall(ViewCounter.FLUSHING_KEY)
+            flush_id = data.pop(ViewCounter.FLUSH_ID_FIELD)
+            deltas = {int(post_id): int(delta) for post_id, delta in data.items()}
+            # 寫回的瀏覽數同時累加熱門分數, 以寫回時間當作瀏覽時間
+            now = timezone.now()
+
+            # 所有批次在同一個 transaction, 任何一批失敗就全部 rollback,
+            # flushing 保留到下次重試, 不會重複累加已寫入的批次
+            with transaction.atomic():
+                _, created = ViewCountFlush.objects.get_or_create(flush_id=flush_id)
+                if not created:
+                    # 這一批已經寫回, 只需要刪除 flushing
+                    deltas = {}
+                ViewCountFlush.objects.filter(
+                    created_at__lt=now - FLUSH_RECORD_RETENTION
+                ).delete()
+
+                # views_count = views_count + CASE WHEN id = ... THEN delta END
+                post_ids = list(deltas)
+                for start in range(0, len(post_ids), FLUSH_BATCH_SIZE):
+                    # 每批延長鎖的期限, 鎖已被其他 worker 取得時拋出例外並 rollback
+                    lock.reacquire()
+                    batch = post_ids[start : start + FLUSH_BATCH_SIZE]
+                    increment = Case(
+                        *[
+                            When(id=post_id, then=Value(deltas[post_id]))
+                            for post_id in batch
+                        ],
+                        default=Value(0),
+                        output_field=PositiveIntegerField(),
+                    )
+                    trending = Case(
+                        *[
+                            When(
+                                id=post_id,
+                                then=Value(
+                                    TrendingScore.exponent(
+                                        WEIGHTS['view'] * deltas[post_id], now
+                                    )
+                                ),
+                            )
+                            for post_id in batch
+                        ],
+                        output_field=FloatField(),
+                    )
+                    Post.objects.filter(id__in=batch).update(
+                        views_count=F('views_count') + increment,
+                        trending_score=TrendingScore.log_add(
+                            F('trending_score'), trending
+                        ),
+                    )
+
+                # commit 之後才刪除 flushing, 刪除失敗時下次以同一個批次 id 重試
+                transaction.on_commit(lambda: client.delete(ViewCounter.FLUSHING_KEY))
+            return deltas
+        finally:
+            try:
+                lock.release()
+            except redis.exceptions.LockError:
+                # 鎖已過期
+                pass
+
+
+class PostCounter:
+    """
+    文章的讚, 收藏, 留言計數
+    - 計數存在 Post 的反正規化欄位, 讀取時只需要一個整數
+    - 寫入時以 F() 原子更新, 必須在建立/刪除關聯資料的同一個 transaction 內呼叫
+    """
+
+    FIELDS = ('like_count', 'bookmark_count', 'comment_count')
+
+    @staticmethod
+    def adjust(
+        post_id: int,
+        field: str,
+        delta: int,
+        created: Sequence[date | datetime] = (),
+    ) -> int:
+        """
+        調整計數並回傳最新的值, 計數不會小於 0
+        :param field: like_count, bookmark_count 或 comment_count
+        :param delta: 增減的數量
+        :param created: 新增或刪除的資料的建立時間, 用來增減熱門分數
+        """
+        if field not in PostCounter.FIELDS:
+            raise ValueError(f'未知的計數欄位: {field}')
+
+        if delta:
+            updates = {field: Greatest(F(field) + delta, 0)}
+            if created:
+                # 以建立時間計算貢獻值, 新增與取消的值相同, 反覆切換不會累積分數
+                exponent = Value(TrendingScore.total_exponent(field, created))
+                combine = TrendingScore.log_add if delta > 0 else TrendingScore.log_sub
+                updates['trending_score'] = combine(F('trending_score'), exponent)
+            Post.objects.filter(id=post_id).update(**updates)
+        return Post.objects.values_list(field, flat=True).get(id=post_id)
+
+    @staticmethod
+    def reconcile() -> int:
+        """
+        以關聯資料表重新計算計數, 修正漂移的文章
+        :return: 修正的文章數量
+        """
+
+        def count_of(model: type) -> Coalesce:
+            return Coalesce(
+                Subquery(
+                    model.objects.filter(post=OuterRef('pk'))
+                    .values('post')
+                    .annotate(total=Count('pk'))
+                    .values('total')
+                ),
+                0,
+            )
+
+        actual = {
+            'like_count': count_of(Like),
+            'bookmark_count': count_of(Bookmark),
+            'comment_count': count_of(Comment),
+        }
+
+        # 只找出計數有誤差的文章, 不要整張表重寫
+        drifted = Q()
+        for field in PostCounter.FIELDS:
+            drifted |= ~Q(**{field: F(f'actual_{field}')})
+
+        drifted_ids = list(
+            Post.objects.annotate(
+                **{f'actual_{field}': expr for field, expr in actual.items()}
+            )
+            .filter(drifted)
+            .values_list('id', flat=True)
+        )
+
+        if drifted_ids:
+            Post.objects.filter(id__in=drifted_ids).update(**actual)
+        return len(drifted_ids)
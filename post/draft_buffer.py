@@ -0,0 +1,208 @@
+import hashlib
+import json
+from typing import Any, Dict
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from post.autosave import DraftAutosaveService
+from post.cache import PostDetailCache
+from post.models import Post, PostContentStep
+from post.search import SearchIndexer
+from shared.redis_client import get_redis
+
+
+class DraftWriteBuffer:
+    """
+    整份文件自動儲存的寫入緩衝
+    - 只在 redis 保留每篇文章最新的標題與內容, 每篇文章每 N 秒最多寫入資料庫一次
+    - 內容 hash 沒有變化時完全不寫入
+    - 剩下的修改由定時任務或發布文章時寫回資料庫
+    """
+
+    ENTRY_KEY = 'post:draft-buffer:{post_id}'
+    FLUSHED_KEY = 'post:draft-buffer:{post_id}:flushed'  # 存在代表剛寫入過資料庫
+    DIRTY_KEY = 'post:draft-buffer:dirty'  # 尚未寫回資料庫的文章 id
+    ENTRY_TTL = 60 * 60 * 24 * 7
+
+    @staticmethod
+    def _hash(title: str, content: Dict[str, Any]) -> str:
+        raw = json.dumps(
+            {'title': title, 'content': content}, sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @staticmethod
+    def get(post: Post) -> Dict[str, Any]:
+        """
+        取得作者看到的最新草稿, 緩衝區的版本比資料庫新時以緩衝區為準
+        :return: title, content, version, hash
+        """
+        try:
+            raw = get_redis().get(DraftWriteBuffer.ENTRY_KEY.format(post_id=post.id))
+        except redis.RedisError:
+            raw = None
+
+        if raw:
+            entry = json.loads(raw)
+            if entry['version'] >= post.draft_version:
+                return entry
+
+        content = DraftAutosaveService.get_draft(post)
+        return {
+            'title': post.title,
+            'content': content,
+            'version': post.draft_version,
+            'hash': DraftWriteBuffer._hash(post.title, content),
+        }
+
+    @staticmethod
+    def save(post: Post, title: str, content: Dict[str, Any]) -> int:
+        """
+        寫入緩衝區, 回傳新的草稿版本
+        """
+        current = DraftWriteBuffer.get(post)
+        content_hash = DraftWriteBuffer._hash(title, content)
+        if content_hash == current['hash']:
+            # 內容沒有變化, 不需要寫入
+            return current['version']
+
+        entry = {
+            'title': title,
+            'content': content,
+            'version': current['version'] + 1,
+            'hash': content_hash,
+        }
+
+        client = get_redis()
+        try:
+            with client.pipeline() as pipe:
+                pipe.set(
+                    DraftWriteBuffer.ENTRY_KEY.format(post_id=post.id),
+                    json.dumps(entry, ensure_ascii=False),
+                    ex=DraftWriteBuffer.ENTRY_TTL,
+                )
+                pipe.sadd(DraftWriteBuffer.DIRTY_KEY, post.id)
+                # 距離上次寫入超過間隔才立即寫入資料庫
+                pipe.set(
+                    DraftWriteBuffer.FLUSHED_KEY.format(post_id=post.id),
+                    1,
+                    nx=True,
+                    ex=settings.DRAFT_FLUSH_INTERVAL,
+                )
+                _, _, should_flush = pipe.execute()
+        except redis.RedisError as e:
+            # redis 無法使用時, 退回直接寫入資料庫
+            print(f'草稿緩衝失敗, 直接寫入資料庫: {e}')
+            DraftWriteBuffer._write(post.id, entry)
+            return entry['version']
+
+        if should_flush:
+            DraftWriteBuffer.flush(post.id)
+        return entry['version']
+
+    @staticmethod
+    def _write(post_id: int, entry: Dict[str, Any]) -> bool:
+        """
+        將緩衝的草稿寫入資料庫, 資料庫已經比較新時略過
+        """
+        with transaction.atomic():
+            post = Post.objects.select_for_update().get(id=post_id)
+            if entry['version'] <= post.draft_version:
+                return False
+
+            # 整份內容覆蓋, 捨棄尚未壓縮的增量修改
+            PostContentStep.objects.filter(post=post).delete()
+            post.title = entry['title']
+            post.content = entry['content']
+            post.draft_version = entry['version']
+            post.content_version = entry['version']
+            post.save(
+                update_fields=[
+                    'title',
+                    'content',
+                    'draft_version',
+                    'content_version',
+                    'updated_at',
+                ]
+            )
+            PostDetailCache.invalidate(post.id)
+            if post.status == 'published':
+                SearchIndexer.schedule(post.id)
+        return True
+
+    @staticmethod
+    def flush(post_id: int) -> bool:
+        """
+        將單篇文章緩衝的草稿寫回資料庫
+        :return: 是否有寫入
+        """
+        client = get_redis()
+        key = DraftWriteBuffer.ENTRY_KEY.format(post_id=post_id)
+        try:
+            raw = client.get(key)
+            if not raw:
+                client.srem(DraftWriteBuffer.DIRTY_KEY, post_id)
+                return False
+        except redis.RedisError as e:
+            # redis 無法使用時, 資料庫的版本就是最新的 (緩衝失敗時會直接寫入資料庫)
+            print(f'草稿緩衝讀取失敗, 使用資料庫的版本: {e}')
+            return False
+
+        try:
+            written = DraftWriteBuffer._write(post_id, json.loads(raw))
+        except Post.DoesNotExist:
+            DraftWriteBuffer.discard(post_id)
+            return False
+
+        def mark_clean() -> None:
+            # 寫入期間沒有新的修改, 才從待寫回清單移除
+            # 緩衝內容保留下來, 之後的自動儲存可以直接比對 hash
+            # 移除失敗時留在清單中, 由定時任務再寫回一次, 已寫入的版本會被略過
+            try:
+                with client.pipeline() as pipe:
+                    pipe.watch(key)
+                    if pipe.get(key) == raw:
+                        pipe.multi()
+                        pipe.srem(DraftWriteBuffer.DIRTY_KEY, post_id)
+                        pipe.execute()
+            except redis.RedisError:
+                pass
+
+        # 在外層 transaction 內呼叫時, 等 commit 之後才移除
+        transaction.on_commit(mark_clean)
+        return written
+
+    @staticmethod
+    def flush_all() -> int:
+        """
+        寫回所有尚未寫回資料庫的草稿
+        :return: 寫入的文章數量
+        """
+        try:
+            post_ids = get_redis().smembers(DraftWriteBuffer.DIRTY_KEY)
+        except redis.RedisError as e:
+            print(f'草稿緩衝讀取失敗: {e}')
+            return 0
+
+        written = 0
+        for post_id in post_ids:
+            if DraftWriteBuffer.flush(int(post_id)):
+                written += 1
+        return written
+
+    @staticmethod
+    def discard(post_id: int) -> None:
+        """
+        刪除文章時一併清除緩衝
+        """
+        client = get_redis()
+        try:
+            client.delete(
+                DraftWriteBuffer.ENTRY_KEY.format(post_id=post_id),
+                DraftWriteBuffer.FLUSHED_KEY.format(post_id=post_id),
+            )
+            client.srem(DraftWriteBuffer.DIRTY_KEY, post_id)
+        except redis.RedisError:
+            pass
@@ -0,0 +1,141 @@
+import copy
+from typing import Any, Dict, List
+
+
+class JsonPatchError(ValueError):
+    """
+    JSON Patch 無法套用
+    """
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    """
+    解析 JSON Pointer (RFC 6901), 例如 /content/0/content/1
+    """
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError(f'無效的路徑: {pointer}')
+    return [
+        part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')
+    ]
+
+
+def _list_index(container: list, token: str, allow_end: bool = False) -> int:
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise JsonPatchError(f'無效的陣列索引: {token}')
+    index = int(token)
+    upper = len(container) if allow_end else len(container) - 1
+    if index > upper:
+        raise JsonPatchError(f'陣列索引超出範圍: {token}')
+    return index
+
+
+def _resolve_parent(document: Any, parts: List[str]) -> Any:
+    """
+    取得路徑最後一段的父節點
+    """
+    node = document
+    for token in parts[:-1]:
+        if isinstance(node, dict):
+            if token not in node:
+                raise JsonPatchError(f'路徑不存在: {token}')
+            node = node[token]
+        elif isinstance(node, list):
+            node = node[_list_index(node, token)]
+        else:
+            raise JsonPatchError(f'路徑不存在: {token}')
+    return node
+
+
+def _get(document: Any, pointer: str) -> Any:
+    parts = _parse_pointer(pointer)
+    if not parts:
+        return document
+    parent = _resolve_parent(document, parts)
+    token = parts[-1]
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f'路徑不存在: {pointer}')
+        return parent[token]
+    if isinstance(parent, list):
+        return parent[_list_index(parent, token)]
+    raise JsonPatchError(f'路徑不存在: {pointer}')
+
+
+def _add(document: Any, pointer: str, value: Any) -> Any:
+    parts = _parse_pointer(pointer)
+    if not parts:
+        return value
+    parent = _resolve_parent(document, parts)
+    token = parts[-1]
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, token, allow_end=True), value)
+    else:
+        raise JsonPatchError(f'無法新增到: {pointer}')
+    return document
+
+
+def _remove(document: Any, pointer: str) -> Any:
+    parts = _parse_pointer(pointer)
+    if not parts:
+        raise JsonPatchError('不能移除整份文件')
+    parent = _resolve_parent(document, parts)
+    token = parts[-1]
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f'路徑不存在: {pointer}')
+        del parent[token]
+    elif isinstance(parent, list):
+        del parent[_list_index(parent, token)]
+    else:
+        raise JsonPatchError(f'路徑不存在: {pointer}')
+    return document
+
+
+def apply_patch(document: Dict[str, Any], operations: List[Dict[str, Any]]) -> Any:
+    """
+    套用 JSON Patch (RFC 6902) 並回傳新的文件, 原本的文件不會被修改
+    - 支援 add, remove, replace, move, copy, test
+    - 任何一個操作失敗就拋出 JsonPatchError, 整批都不套用
+    """
+    document = copy.deepcopy(document)
+
+    for operation in operations:
+        op = operation.get('op')
+        path = operation.get('path')
+        if not isinstance(path, str):
+            raise JsonPatchError('缺少 path')
+
+        if op == 'add':
+            document = _add(document, path, copy.deepcopy(operation.get('value')))
+        elif op == 'remove':
+            document = _remove(document, path)
+        elif op == 'replace':
+            _get(document, path)  # 目標必須存在
+            if path == '':
+                document = copy.deepcopy(operation.get('value'))
+            else:
+                document = _remove(document, path)
+                document = _add(document, path, copy.deepcopy(operation.get('value')))
+        elif op in ('move', 'copy'):
+            from_path = operation.get('from')
+            if not isinstance(from_path, str):
+                raise JsonPatchError('缺少 from')
+            if op == 'move' and path.startswith(from_path + '/'):
+                raise JsonPatchError('不能移動到自己的子節點')
+            value = copy.deepcopy(_get(document, from_path))
+            if op == 'move':
+                document = _remove(document, from_path)
+            document = _add(document, path, value)
+        elif op == 'test':
+            if _get(document, path) != operation.get('value'):
+                raise JsonPatchError(f'test 失敗: {path}')
+        else:
+            raise JsonPatchError(f'不支援的操作: {op}')
+
+    return document
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from post.models import Post
+from post.services import ProseMirrorContentExtrator
+
+
+class Command(BaseCommand):
+    help = '為已發布的文章產生 content_meta (大綱, 字數, 閱讀時間等衍生資料)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='重新產生所有已發布文章, 預設只處理尚未產生的文章',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(status='published').only('id', 'content')
+        if not options['all']:
+            posts = posts.filter(content_meta={})
+
+        updated = 0
+        for post in posts.iterator(chunk_size=200):
+            analysis = ProseMirrorContentExtrator.analyze(post.content)
+            content_meta = ProseMirrorContentExtrator.build_content_meta(analysis)
+            # 用 update 避免改動 updated_at
+            Post.objects.filter(id=post.id).update(content_meta=content_meta)
+            updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'已更新 {updated} 篇文章的衍生資料'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from post.related import RelatedPostIndex
+
+
+class Command(BaseCommand):
+    help = '依標籤共現重新計算所有已發布文章的相似文章'
+
+    def handle(self, *args, **options):
+        total = RelatedPostIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'已重新計算 {total} 篇文章的相似文章'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from post.models import Post, PostSearchDocument
+from post.search import SearchIndexer
+
+
+class Command(BaseCommand):
+    help = '重新建立所有已發布文章的全文檢索索引'
+
+    def handle(self, *args, **options):
+        post_ids = list(
+            Post.objects.filter(status='published').values_list('id', flat=True)
+        )
+
+        # 移除已經不是發布狀態的索引
+        stale_ids = PostSearchDocument.objects.exclude(post_id__in=post_ids)
+        for post_id in stale_ids.values_list('post_id', flat=True):
+            SearchIndexer.remove_post(post_id)
+
+        for post_id in post_ids:
+            SearchIndexer.index_post(post_id)
+
+        self.stdout.write(self.style.SUCCESS(f'已建立 {len(post_ids)} 篇文章的索引'))
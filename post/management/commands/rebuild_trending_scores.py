@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from post.trending import TrendingScore
+
+
+class Command(BaseCommand):
+    help = '從讚, 收藏, 留言與瀏覽數重新計算所有已發布文章的熱門分數'
+
+    def handle(self, *args, **options):
+        updated = TrendingScore.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'已重新計算 {updated} 篇文章的熱門分數'))
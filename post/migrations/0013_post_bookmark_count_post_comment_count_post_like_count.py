@@ -0,0 +1,59 @@
+# Generated by Django 5.1.7 on 2026-10-17 10:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_post_counters(apps, schema_editor):
+    """
+    依照現有的讚, 收藏, 留言資料填入計數欄位
+    """
+    Post = apps.get_model('post', 'Post')
+    Like = apps.get_model('post', 'Like')
+    Bookmark = apps.get_model('post', 'Bookmark')
+    Comment = apps.get_model('comment', 'Comment')
+
+    def count_of(model):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(post=OuterRef('pk'))
+                .values('post')
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            0,
+        )
+
+    Post.objects.update(
+        like_count=count_of(Like),
+        bookmark_count=count_of(Bookmark),
+        comment_count=count_of(Comment),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0001_initial'),
+        ('post', '0012_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='bookmark_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_post_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0013_post_bookmark_count_post_comment_count_post_like_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_meta',
+            field=models.JSONField(blank=True, default=dict, help_text='發布時由文章內容產生的衍生資料: 圖片, 影片, 大綱, 字數, 閱讀時間'),
+        ),
+    ]
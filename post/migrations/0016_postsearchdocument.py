@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-17 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+PG_VECTOR_SQL = (
+    "(setweight(to_tsvector('simple', title_tokens), 'A') || "
+    "setweight(to_tsvector('simple', body_tokens), 'B'))"
+)
+
+
+def create_search_backend(apps, schema_editor):
+    """
+    依資料庫建立全文檢索索引
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX post_search_vector_gin '
+            f'ON post_postsearchdocument USING gin ({PG_VECTOR_SQL})'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE post_search_fts '
+            'USING fts5(title_tokens, body_tokens, post_id UNINDEXED)'
+        )
+
+
+def drop_search_backend(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS post_search_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS post_search_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0015_post_content_version_post_draft_version_postcontentstep'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSearchDocument',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='post.post')),
+                ('title_tokens', models.TextField(blank=True, default='')),
+                ('body_tokens', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_backend, drop_search_backend),
+    ]
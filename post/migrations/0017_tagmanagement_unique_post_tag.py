@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-17 14:02
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_tag_links(apps, schema_editor):
+    """
+    加上唯一限制前, 刪除重複的文章標籤連結, 保留最早的一筆
+    """
+    TagManagement = apps.get_model('post', 'TagManagement')
+    duplicates = (
+        TagManagement.objects.values('post_id', 'tag_id')
+        .annotate(first_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        TagManagement.objects.filter(
+            post_id=row['post_id'], tag_id=row['tag_id']
+        ).exclude(id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0016_postsearchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_tag_links, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tagmanagement',
+            constraint=models.UniqueConstraint(
+                fields=('post', 'tag'), name='unique_post_tag'
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-17 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0017_tagmanagement_unique_post_tag'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='post_feed_keyset_idx'),
+        ),
+    ]
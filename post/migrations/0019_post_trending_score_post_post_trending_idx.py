@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-17 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0018_post_post_feed_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-trending_score', '-id'], name='post_trending_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-17 15:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0019_post_trending_score_post_post_trending_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_posts', to='post.post')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='post.post')),
+            ],
+            options={
+                'ordering': ['post', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('post', 'related'), name='unique_related_post')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0020_relatedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewCountFlush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flush_id', models.CharField(max_length=32, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
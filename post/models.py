@@ -29,6 +29,11 @@ class TagManagement(models.Model):
     post = models.ForeignKey('Post', on_delete=models.CASCADE)
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'tag'], name='unique_post_tag'),
+        ]
+
     def __str__(self) -> str:
         return f'{self.post.title} - {self.tag.name}'
 
@@ -53,6 +58,11 @@ class Post(models.Model):
         null=True,
         help_text='文章縮圖 URL, 用於文章列表或社交媒體分享',
     )
+    content_meta = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='發布時由文章內容產生的衍生資料: 圖片, 影片, 大綱, 字數, 閱讀時間',
+    )
 
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
@@ -79,12 +89,60 @@ class Post(models.Model):
         ],
         default='public',
     )
+    # 增量自動儲存的版本
+    # draft_version: 最新的草稿版本, content_version: content 欄位目前對應的版本
+    # 兩者之間的差異存在 PostContentStep, 定期壓縮回 content
+    draft_version = models.PositiveIntegerField(default=0)
+    content_version = models.PositiveIntegerField(default=0)
     views_count = models.PositiveIntegerField(default=0)
 
+    # 反正規化的計數欄位, 由 toggle API 以 F() 原子更新, 定時任務修正誤差
+    like_count = models.PositiveIntegerField(default=0)
+    bookmark_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # 熱門分數 log2(Σ 權重 * 2^(時間 / 半衰期)), 由互動增量更新, 見 post.trending
+    trending_score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            # 首頁 keyset 分頁: WHERE status = ... ORDER BY created_at DESC, id DESC
+            models.Index(
+                fields=['status', '-created_at', '-id'], name='post_feed_keyset_idx'
+            ),
+            # 熱門列表: WHERE status = ... ORDER BY trending_score DESC, id DESC
+            models.Index(
+                fields=['status', '-trending_score', '-id'], name='post_trending_idx'
+            ),
+        ]
+
     def __str__(self) -> str:
         return self.title
 
 
+class PostContentStep(models.Model):
+    """
+    自動儲存的增量修改, 內容為 JSON Patch 操作
+    """
+
+    post = models.ForeignKey(
+        'Post', on_delete=models.CASCADE, related_name='content_steps'
+    )
+    version = models.PositiveIntegerField()  # 套用後的草稿版本
+    operations = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['version']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'version'], name='unique_post_content_step'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.post_id} v{self.version}'
+
+
 class Like(models.Model):
     """
     讚
@@ -103,6 +161,63 @@ class Like(models.Model):
         return f'{self.user.username} 喜歡這篇文章 {self.post.title}'
 
 
+class PostSearchDocument(models.Model):
+    """
+    全文檢索索引, 內容是切詞後以空白分隔的字串
+    - PostgreSQL 在 tsvector 運算式上建立 GIN 索引, SQLite 另外維護 FTS5 虛擬表
+    """
+
+    post = models.OneToOneField(
+        'Post',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+    )
+    title_tokens = models.TextField(default='', blank=True)
+    body_tokens = models.TextField(default='', blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.post_id} 的檢索索引'
+
+
+class RelatedPost(models.Model):
+    """
+    依標籤共現預先計算的相似文章, 每篇文章保留前 RELATED_POSTS_TOP_K 篇
+    """
+
+    post = models.ForeignKey(
+        'Post', on_delete=models.CASCADE, related_name='related_posts'
+    )
+    related = models.ForeignKey('Post', on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()  # Jaccard 相似度
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['post', 'rank']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'related'], name='unique_related_post'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.post_id} -> {self.related_id}'
+
+
+class ViewCountFlush(models.Model):
+    """
+    已寫回資料庫的瀏覽數批次, 和瀏覽數在同一個 transaction 寫入
+    - 同一批次重試時已有紀錄, 不會重複累加
+    """
+
+    flush_id = models.CharField(max_length=32, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return self.flush_id
+
+
 def post_image_path(instance: models, filename: str) -> str:
     """
     圖片儲存路徑
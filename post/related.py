@@ -0,0 +1,211 @@
+import heapq
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+from django.conf import settings
+from django.contrib.auth.models import AbstractUser
+from django.db import transaction
+from django.db.models import Count
+
+from post.models import Post, RelatedPost, TagManagement
+from post.services import GetPostService, project_post_list
+
+
+class _TagMatrix:
+    """
+    稀疏的文章 x 標籤矩陣, 以 array 儲存每一列與每一行的 id
+    - tags_of: 要計算相似文章的文章 -> 標籤 id
+    - posts_of: 標籤 -> 使用此標籤的文章 id (倒排索引)
+    - size_of: 候選文章的標籤數, 計算 Jaccard 的分母
+    """
+
+    __slots__ = ('tags_of', 'posts_of', 'size_of')
+
+    def __init__(self) -> None:
+        self.tags_of: Dict[int, array] = {}
+        self.posts_of: Dict[int, array] = {}
+        self.size_of: Dict[int, int] = {}
+
+    @classmethod
+    def full(cls) -> '_TagMatrix':
+        """
+        載入所有已發布文章的標籤
+        """
+        matrix = cls()
+        rows = (
+            TagManagement.objects.filter(post__status='published')
+            .values_list('post_id', 'tag_id')
+            .iterator(chunk_size=5000)
+        )
+        for post_id, tag_id in rows:
+            matrix.tags_of.setdefault(post_id, array('q')).append(tag_id)
+            matrix.posts_of.setdefault(tag_id, array('q')).append(post_id)
+        matrix.size_of = {
+            post_id: len(tags) for post_id, tags in matrix.tags_of.items()
+        }
+        return matrix
+
+    @classmethod
+    def around(cls, post_ids: Iterable[int]) -> '_TagMatrix':
+        """
+        只載入計算指定文章需要的部分: 文章的標籤, 這些標籤的倒排索引, 候選文章的標籤數
+        """
+        matrix = cls()
+        published = TagManagement.objects.filter(post__status='published')
+        rows = published.filter(post_id__in=list(post_ids)).values_list(
+            'post_id', 'tag_id'
+        )
+        for post_id, tag_id in rows:
+            matrix.tags_of.setdefault(post_id, array('q')).append(tag_id)
+
+        tag_ids = {tag_id for tags in matrix.tags_of.values() for tag_id in tags}
+        # 太常見的標籤不產生候選, 避免倒排索引過長
+        common_tags = set(
+            published.filter(tag_id__in=tag_ids)
+            .values('tag_id')
+            .annotate(total=Count('post_id'))
+            .filter(total__gt=settings.RELATED_POSTS_MAX_TAG_POSTS)
+            .values_list('tag_id', flat=True)
+        )
+        for post_id, tag_id in published.filter(
+            tag_id__in=tag_ids - common_tags
+        ).values_list('post_id', 'tag_id'):
+            matrix.posts_of.setdefault(tag_id, array('q')).append(post_id)
+
+        candidates = {
+            post_id for posts in matrix.posts_of.values() for post_id in posts
+        }
+        matrix.size_of = dict(
+            published.filter(post_id__in=candidates)
+            .values('post_id')
+            .annotate(total=Count('tag_id'))
+            .values_list('post_id', 'total')
+        )
+        return matrix
+
+    def neighbours(self, post_id: int, k: int) -> List[tuple[float, int]]:
+        """
+        以 Jaccard 相似度取出前 k 篇相似文章
+        :return: [(相似度, 文章 id)], 相似度由高到低
+        """
+        tags = self.tags_of.get(post_id)
+        if not tags:
+            return []
+
+        # 交集大小: 走過每個標籤的倒排索引累加
+        overlap: Counter[int] = Counter()
+        for tag_id in tags:
+            posts = self.posts_of.get(tag_id)
+            if posts and len(posts) <= settings.RELATED_POSTS_MAX_TAG_POSTS:
+                overlap.update(posts)
+        overlap.pop(post_id, None)
+
+        size = len(tags)
+        scored = (
+            (shared / (size + self.size_of.get(other, shared) - shared), other)
+            for other, shared in overlap.items()
+        )
+        # 相似度相同時, id 較大 (較新) 的文章優先
+        return heapq.nlargest(k, scored)
+
+
+class RelatedPostIndex:
+    """
+    依標籤共現預先計算的相似文章
+    - 定時任務載入整個文章 x 標籤矩陣重新計算, 結果存在 RelatedPost
+    - 文章標籤變動時, 只重新計算這篇文章, 原本列出它的文章, 以及和它有共同標籤的文章
+    - 讀取時再過濾狀態與可見性
+    """
+
+    @staticmethod
+    def schedule(post_id: int) -> None:
+        """
+        transaction commit 之後, 交給 celery 重新計算單篇文章的相似文章
+        """
+        from post.tasks import refresh_related_posts
+
+        transaction.on_commit(lambda: refresh_related_posts.delay(post_id))
+
+    @staticmethod
+    def _store(matrix: _TagMatrix, post_ids: Iterable[int]) -> Dict[int, List[int]]:
+        k = settings.RELATED_POSTS_TOP_K
+        related: Dict[int, List[int]] = {}
+        rows = []
+        for post_id in post_ids:
+            neighbours = matrix.neighbours(post_id, k)
+            related[post_id] = [other for _, other in neighbours]
+            rows.extend(
+                RelatedPost(post_id=post_id, related_id=other, score=score, rank=rank)
+                for rank, (score, other) in enumerate(neighbours)
+            )
+
+        with transaction.atomic():
+            RelatedPost.objects.filter(post_id__in=list(related)).delete()
+            RelatedPost.objects.bulk_create(rows, batch_size=1000)
+        return related
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """
+        重新計算所有已發布文章的相似文章
+        :return: 有標籤的文章數
+        """
+        matrix = _TagMatrix.full()
+        with transaction.atomic():
+            RelatedPost.objects.all().delete()
+            cls._store(matrix, list(matrix.tags_of))
+        return len(matrix.tags_of)
+
+    @classmethod
+    def refresh(cls, post_id: int) -> int:
+        """
+        標籤變動後增量更新
+        :return: 重新計算的文章數
+        """
+        matrix = _TagMatrix.around([post_id])
+        cls._store(matrix, [post_id])
+
+        # 受影響的是原本列出此文章的文章, 以及所有和此文章有共同標籤的文章
+        # 後者的前 k 篇可能因此加入此文章, 即使此文章的前 k 篇不包含它們
+        affected = set(
+            RelatedPost.objects.filter(related_id=post_id).values_list(
+                'post_id', flat=True
+            )
+        )
+        for posts in matrix.posts_of.values():
+            affected.update(posts)
+        affected.discard(post_id)
+        if affected:
+            cls._store(_TagMatrix.around(affected), affected)
+        return len(affected) + 1
+
+    @staticmethod
+    def get_related(
+        post_id: int, user: AbstractUser | None = None, limit: int = 6
+    ) -> List[Dict[str, Any]]:
+        """
+        查詢相似文章, 只回傳使用者看得到的文章
+        """
+        related_ids = list(
+            RelatedPost.objects.filter(post_id=post_id)
+            .order_by('rank')
+            .values_list('related_id', flat=True)
+        )
+        if not related_ids:
+            return []
+
+        rows = GetPostService.filter_visible(
+            list(
+                project_post_list(
+                    Post.objects.filter(id__in=related_ids, status='published')
+                )
+            ),
+            user=user,
+        )
+        rows_by_id = {row['id']: row for row in rows}
+        return [
+            rows_by_id[related_id]
+            for related_id in related_ids
+            if related_id in rows_by_id
+        ][:limit]
@@ -1,10 +1,9 @@
 from datetime import datetime
 from typing import Any, Dict, List
 
+from django.core.files.storage import default_storage
 from ninja import Field, Schema
 
-from .models import Post
-
 
 class _AuthorInfo(Schema):
     """
@@ -17,17 +16,24 @@ class _AuthorInfo(Schema):
     avatar_url: str | None = Field(examples=['https://example.com/avatar.jpg'])
 
 
+class _OutlineItem(Schema):
+    """
+    文章標題大綱
+    """
+
+    level: int = Field(examples=[2])
+    text: str = Field(examples=['小標題'])
+
+
 class PostListOut(Schema):
     """
     文章列表輸出
     """
 
-    # 欲新增 post_id, 重要！
+    # 列表查詢使用 values() 投影欄位, obj 是 dict 而不是 Post 實例
     # 關聯的作者欄位
-    author_name: str | None = Field(alias='author.username', examples=['寶淇'])
-    author_avatar: str | None = Field(
-        alias='author.avatar', examples=['https://example.com/avatar.jpg']
-    )
+    author_name: str | None = Field(examples=['寶淇'])
+    author_avatar: str | None = Field(examples=['https://example.com/avatar.jpg'])
 
     # 文章欄位
     id: int = Field(example=['1'])  # 文章ID
@@ -35,10 +41,24 @@ class PostListOut(Schema):
     title: str = Field(examples=['文章標題'])
     summery: str | None = Field(examples=['文章摘要'])  # 拼錯 是a 不是e
     thumbnail_url: str | None = Field(examples='https://example.com/thumbnail.jpg')
+    like_count: int = Field(default=0, examples=[10])
+    bookmark_count: int = Field(default=0, examples=[3])
+    comment_count: int = Field(default=0, examples=[5])
+    reading_time: int = Field(default=0, examples=[3])  # 分鐘
 
     @staticmethod
-    def resolve_updated_at(obj: Post) -> str:
-        return obj.updated_at.strftime('%Y-%m-%d')
+    def resolve_updated_at(obj: Dict[str, Any]) -> str:
+        return obj['updated_at'].strftime('%Y-%m-%d')
+
+    @staticmethod
+    def resolve_author_avatar(obj: Dict[str, Any]) -> str | None:
+        # values() 取得的是檔案路徑, 轉成和 ImageField.url 相同的網址
+        avatar = obj.get('author_avatar')
+        return default_storage.url(avatar) if avatar else None
+
+    @staticmethod
+    def resolve_reading_time(obj: Dict[str, Any]) -> int:
+        return obj.get('reading_time') or 0
 
 
 class UpdatePostContentIn(Schema):
@@ -64,6 +84,34 @@ class UpdatePostContentIn(Schema):
             ],
         },
     )
+    version: int | None = Field(default=None, examples=[12])  # 有帶才檢查版本
+
+
+class UpdatePostStepsIn(Schema):
+    """
+    增量更新文章內容
+    """
+
+    version: int = Field(examples=[12])  # 用戶端目前的草稿版本
+    # JSON Patch (RFC 6902) 操作
+    operations: List[Dict[str, Any]] = Field(
+        examples=[
+            [{'op': 'replace', 'path': '/content/0/content/0/text', 'value': '內容'}]
+        ]
+    )
+    title: str | None = Field(default=None, max_length=255, examples=['title'])
+
+
+class PostDraftOut(Schema):
+    """
+    草稿內容輸出
+    """
+
+    id: int = Field(examples=[1])
+    title: str = Field(examples=['文章標題'])
+    content: Dict[str, Any] = Field(examples=[{'type': 'doc', 'content': []}])
+    version: int = Field(examples=[12])  # 草稿版本, 增量更新時要帶上
+    status: str = Field(examples=['draft', 'published'])
 
 
 class UpdatePostTagIn(Schema):
@@ -91,7 +139,12 @@ class GetPostDetailOut(Schema):
     followers: int = Field(examples=[2486])
     tags: List[str] = Field(default=[], examples=[['資料科學', '桌上遊戲']])
     like_count: int = Field(examples=[10])
+    bookmark_count: int = Field(default=0, examples=[3])
+    comment_count: int = Field(default=0, examples=[5])
     views_count: int = Field(examples=[100])
+    outline: List[_OutlineItem] = Field(default=[])  # 標題大綱
+    word_count: int = Field(default=0, examples=[1200])
+    reading_time: int = Field(default=0, examples=[3])  # 分鐘
 
 
 class BookmarkToggleOut(Schema):
@@ -110,3 +163,13 @@ class LikeStatusOut(Schema):
 
     is_liked: bool = Field(default=False, examples=['False=沒讚, True=已讚'])
     total_likes: int = Field(examples=['總讚數'])
+
+
+class TagSuggestOut(Schema):
+    """
+    標籤自動完成
+    """
+
+    name: str = Field(examples=['資料科學'])
+    slug: str = Field(examples=['資料科學'])
+    usage: int = Field(examples=[12])  # 使用次數
@@ -0,0 +1,200 @@
+import re
+import unicodedata
+from typing import Any, Dict, List
+
+from django.contrib.auth.models import AbstractUser
+from django.db import connection, transaction
+from django.db.models import Q, TextField, Value
+from django.db.models.functions import Concat
+
+from post.models import Post, PostSearchDocument
+from post.services import ProseMirrorContentExtrator, project_post_list
+
+# 中日韓文字連續的片段, 用二元組(bigram)切詞, 建立索引時另外加上單字(unigram)
+_TOKEN_PATTERN = re.compile(
+    r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)'
+    r'|([0-9a-z]+)'
+)
+
+# PostgreSQL 的 tsvector 運算式, 需要和 migration 建立的 GIN 索引完全一致
+PG_VECTOR_SQL = (
+    "(setweight(to_tsvector('simple', title_tokens), 'A') || "
+    "setweight(to_tsvector('simple', body_tokens), 'B'))"
+)
+# SQLite 的 FTS5 虛擬表
+SQLITE_FTS_TABLE = 'post_search_fts'
+
+# 排名後最多取出多少候選文章, 再做可見性過濾
+MAX_CANDIDATES = 500
+
+
+def tokenize(text: str, unigrams: bool = False) -> List[str]:
+    """
+    中文切成相鄰兩字的二元組, 英文與數字以單字為單位
+    例如 '資料科學 Django' -> ['資料', '料科', '科學', 'django']
+    :param unigrams: 中文另外加上每個單字, 建立索引時使用, 讓單字查詢可以找到詞中的字
+    """
+    if not text:
+        return []
+
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = []
+    for cjk, word in _TOKEN_PATTERN.findall(text):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i : i + 2] for i in range(len(cjk) - 1))
+            if unigrams:
+                tokens.extend(cjk)
+    return tokens
+
+
+class SearchIndexer:
+    """
+    文章全文檢索索引
+    - 索引內容是切詞後以空白分隔的字串, 資料庫只需要依空白斷詞
+    - PostgreSQL 使用 tsvector + GIN 索引, SQLite 使用 FTS5
+    """
+
+    @staticmethod
+    def schedule(post_id: int) -> None:
+        """
+        transaction commit 之後, 交給 celery 更新單篇文章的索引
+        """
+        from post.tasks import update_post_search_index
+
+        transaction.on_commit(lambda: update_post_search_index.delay(post_id))
+
+    @staticmethod
+    def index_post(post_id: int) -> bool:
+        """
+        更新單篇文章的索引, 文章不存在或未發布時移除索引
+        :return: 文章是否在索引中
+        """
+        post = (
+            Post.objects.filter(id=post_id, status='published')
+            .only('id', 'title', 'summery', 'content')
+            .first()
+        )
+        if post is None:
+            SearchIndexer.remove_post(post_id)
+            return False
+
+        plain_text = ProseMirrorContentExtrator.analyze(post.content)['plain_text']
+        title_tokens = ' '.join(tokenize(post.title, unigrams=True))
+        body_tokens = ' '.join(
+            tokenize(f'{post.summery or ""}\n{plain_text}', unigrams=True)
+        )
+
+        with transaction.atomic():
+            PostSearchDocument.objects.update_or_create(
+                post_id=post_id,
+                defaults={'title_tokens': title_tokens, 'body_tokens': body_tokens},
+            )
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'DELETE FROM {SQLITE_FTS_TABLE} WHERE post_id = %s', [post_id]
+                    )
+                    cursor.execute(
+                        f'INSERT INTO {SQLITE_FTS_TABLE} '
+                        '(title_tokens, body_tokens, post_id) VALUES (%s, %s, %s)',
+                        [title_tokens, body_tokens, post_id],
+                    )
+        return True
+
+    @staticmethod
+    def remove_post(post_id: int) -> None:
+        """
+        移除單篇文章的索引
+        """
+        PostSearchDocument.objects.filter(post_id=post_id).delete()
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {SQLITE_FTS_TABLE} WHERE post_id = %s', [post_id]
+                )
+
+    @staticmethod
+    def search_ids(query: str, limit: int = MAX_CANDIDATES) -> List[int]:
+        """
+        依相關度排序, 回傳符合所有關鍵字的文章 id
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))  # 去除重複並保留順序
+        if not tokens:
+            return []
+
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            return SearchIndexer._search_ids_fallback(tokens, limit)
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'SELECT post_id FROM post_postsearchdocument, '
+                    f"to_tsquery('simple', %s) query "
+                    f'WHERE {PG_VECTOR_SQL} @@ query '
+                    f'ORDER BY ts_rank({PG_VECTOR_SQL}, query) DESC, post_id DESC '
+                    f'LIMIT %s',
+                    [' & '.join(tokens), limit],
+                )
+            elif connection.vendor == 'sqlite':
+                # bm25 越小越相關, 標題權重較高
+                cursor.execute(
+                    f'SELECT post_id FROM {SQLITE_FTS_TABLE} '
+                    f'WHERE {SQLITE_FTS_TABLE} MATCH %s '
+                    f'ORDER BY bm25({SQLITE_FTS_TABLE}, 2.0, 1.0) LIMIT %s',
+                    [' AND '.join(f'"{token}"' for token in tokens), limit],
+                )
+            return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def _search_ids_fallback(tokens: List[str], limit: int) -> List[int]:
+        """
+        沒有全文檢索的資料庫, 以字串比對索引內容, 新文章排前面
+        - 前後補上空白再比對, 只符合完整的 token
+        """
+        queryset = PostSearchDocument.objects.annotate(
+            padded_title=Concat(
+                Value(' '), 'title_tokens', Value(' '), output_field=TextField()
+            ),
+            padded_body=Concat(
+                Value(' '), 'body_tokens', Value(' '), output_field=TextField()
+            ),
+        )
+        for token in tokens:
+            needle = f' {token} '
+            queryset = queryset.filter(
+                Q(padded_title__contains=needle) | Q(padded_body__contains=needle)
+            )
+        return list(
+            queryset.order_by('-post_id').values_list('post_id', flat=True)[:limit]
+        )
+
+    @staticmethod
+    def search(
+        query: str,
+        user: AbstractUser | None = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """
+        全文檢索已發布的文章, 依相關度排序並過濾可見性
+        :param user: 當前登入使用者, 如果沒有登入則為 None
+        """
+        from core.service import PostService
+
+        ranked_ids = SearchIndexer.search_ids(query)
+        if not ranked_ids:
+            return []
+
+        queryset = Post.objects.filter(id__in=ranked_ids, status='published')
+        if user:
+            queryset = queryset.filter(PostService._get_auth_user_conditions(user))
+        else:
+            queryset = queryset.filter(visibility='public')
+
+        rows = {row['id']: row for row in project_post_list(queryset)}
+        visible = [rows[post_id] for post_id in ranked_ids if post_id in rows]
+        return visible[offset : offset + limit]
@@ -1,35 +1,143 @@
+import math
+import re
 from typing import Any, Dict, List
 
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import connection
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    QuerySet,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
 
-from post.models import Post
+from post.models import Post, TagManagement
 from user.models import Follow
+from user.services import FollowGraphCache
+
+
+# 中日韓文字, 每個字算一個字
+CJK_PATTERN = re.compile(
+    r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]'
+)
+# 拉丁文字與數字, 以單字計算
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+(?:['’\-][A-Za-z0-9]+)*")
+# 閱讀速度, 用來估計閱讀時間
+CJK_CHARS_PER_MINUTE = 400
+WORDS_PER_MINUTE = 200
+
+# 遍歷時標記區塊與標題結束的記號
+_BLOCK_END = object()
+_HEADING_END = object()
 
 
 class ProseMirrorContentExtrator:
     @staticmethod
-    def extract_plain_text(pm_json: Dict[str, Any]) -> str:
+    def analyze(pm_json: Dict[str, Any]) -> Dict[str, Any]:
         """
-        從 ProseMirror JSON 結構中提取純文本內容
+        一次遍歷 ProseMirror JSON, 取得純文字, 圖片, 影片, 標題大綱, 字數與閱讀時間
+        - 使用堆疊迭代, 不會因為文件太深而超過遞迴上限
+        :return: plain_text, first_image, images, videos, outline,
+                 word_count, reading_time(分鐘)
         """
+        result = {
+            'plain_text': '',
+            'first_image': None,
+            'images': [],
+            'videos': [],
+            'outline': [],
+            'word_count': 0,
+            'reading_time': 0,
+        }
         if not isinstance(pm_json, dict) or 'type' not in pm_json:
-            return ''
+            return result
+
+        text_content = []  # 文字節點, 組成摘要用的純文字
+        segments = []  # 文字節點加上區塊分隔, 計算字數用
+        heading = None  # 目前所在的標題
+
+        # 反向放入堆疊, 取出時才會是文件順序
+        stack = list(reversed(pm_json.get('content') or []))
+        while stack:
+            node = stack.pop()
+
+            # 區塊結束, 區塊之間加上分隔避免單字黏在一起
+            if node is _BLOCK_END or node is _HEADING_END:
+                segments.append('\n')
+                if node is _HEADING_END:
+                    heading = None
+                continue
+            if not isinstance(node, dict):
+                continue
+
+            node_type = node.get('type')
+            attrs = node.get('attrs') or {}
+
+            if node_type == 'text':
+                text = node.get('text') or ''
+                text_content.append(text)
+                segments.append(text)
+                if heading is not None:
+                    heading['text'] += text
+                continue
+
+            if node_type == 'image' and attrs.get('src'):
+                result['images'].append(attrs['src'])
+            elif node_type == 'video' and attrs.get('src'):
+                result['videos'].append(attrs['src'])
+
+            children = node.get('content')
+            if not children:
+                continue
 
-        text_content = []
+            if node_type == 'heading':
+                heading = {'level': attrs.get('level', 1), 'text': ''}
+                result['outline'].append(heading)
+                stack.append(_HEADING_END)
+            else:
+                stack.append(_BLOCK_END)
+            stack.extend(reversed(children))
 
-        # 遞迴遍歷 ProseMirror JSON 結構中的節點
-        def traverse_nodes(nodes: List[Dict[str, Any]]):
-            for node in nodes:
-                if node.get('type') == 'text' and 'text' in node:
-                    text_content.append(node['text'])
-                if 'content' in node:
-                    traverse_nodes(node['content'])
+        for item in result['outline']:
+            item['text'] = item['text'].strip()
 
-        # 遞迴入口
-        if 'content' in pm_json:
-            traverse_nodes(pm_json['content'])
+        analysis_text = ''.join(segments)
+        cjk_chars = len(CJK_PATTERN.findall(analysis_text))
+        words = len(WORD_PATTERN.findall(analysis_text))
 
-        return ''.join(text_content).strip()
+        result['plain_text'] = ''.join(text_content).strip()
+        result['first_image'] = result['images'][0] if result['images'] else None
+        result['word_count'] = cjk_chars + words
+        if result['word_count']:
+            minutes = cjk_chars / CJK_CHARS_PER_MINUTE + words / WORDS_PER_MINUTE
+            result['reading_time'] = max(1, math.ceil(minutes))
+        return result
+
+    @staticmethod
+    def build_content_meta(analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        發布時存進 Post.content_meta 的衍生資料, 列表與單篇文章不需要再遍歷內容
+        :param analysis: analyze() 的結果
+        """
+        return {
+            'images': analysis['images'],
+            'videos': analysis['videos'],
+            'outline': analysis['outline'],
+            'word_count': analysis['word_count'],
+            'reading_time': analysis['reading_time'],
+        }
+
+    @staticmethod
+    def extract_plain_text(pm_json: Dict[str, Any]) -> str:
+        """
+        從 ProseMirror JSON 結構中提取純文本內容
+        """
+        return ProseMirrorContentExtrator.analyze(pm_json)['plain_text']
 
     @staticmethod
     def extract_first_image_url(pm_json: Dict[str, Any]) -> str:
@@ -37,41 +145,72 @@ class ProseMirrorContentExtrator:
         從 ProseMirror JSON 結構中提取第一個圖片 URL
         假設圖片節點的 type 為 'image' 且 URL 在 attrs.src 中
         """
-        if not isinstance(pm_json, dict) or 'type' not in pm_json:
-            return None
+        return ProseMirrorContentExtrator.analyze(pm_json)['first_image']
 
-        # 遞迴遍歷 ProseMirror JSON 結構中的節點
-        def traverse_nodes(nodes: List[Dict[str, Any]]):
-            for node in nodes:
-                if node.get('type') == 'image' and node.get('attrs', {}).get('src'):
-                    print(f'找到圖片 URL: {node["attrs"]["src"]}')
-                    return node['attrs']['src']
 
-                if 'content' in node:
-                    result = traverse_nodes(node['content'])
-
-                    # 如果在子節點中找到圖片 URL, 才會跑到這裡
-                    # 若在父節點中找到圖片 URL, 則不會進入這個 if
-                    if result:
-                        print(f'從子層接收到結果，向上返回: {result}')
-                        return result
+class GetPostService:
+    @staticmethod
+    def get_detail_queryset(user: AbstractUser | None = None) -> QuerySet[Post]:
+        """
+        單篇文章的查詢, 一次查出作者, 追蹤者數量, 標籤與讀者的追蹤關係
+        - 不載入標題與內容, 由內容快取提供
+        :param user: 當前登入使用者, 用來判斷是否追蹤作者
+        """
+        followers_count = Coalesce(
+            Subquery(
+                Follow.objects.filter(following=OuterRef('author'))
+                .values('following')
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            0,
+        )
 
-            # 如果結果不是 None, 則返回結果
-            print('沒有找到圖片 URL')
-            return None
+        if user:
+            is_following = Exists(
+                Follow.objects.filter(follower=user, following=OuterRef('author'))
+            )
+        else:
+            is_following = Value(False)
 
-        # 遞迴入口
-        if 'content' in pm_json:
-            return traverse_nodes(pm_json['content'])
+        queryset = (
+            Post.objects.select_related('author')
+            .defer('title', 'content')
+            .annotate(followers_count=followers_count, is_following=is_following)
+        )
 
-        return None
+        # PostgreSQL 可以用陣列子查詢一併取得標籤名稱
+        if connection.vendor == 'postgresql':
+            queryset = queryset.annotate(
+                tag_names=ArraySubquery(
+                    TagManagement.objects.filter(post=OuterRef('pk'))
+                    .order_by('id')
+                    .values('tag__name')
+                )
+            )
+        return queryset
 
+    @staticmethod
+    def get_tag_names(post: Post) -> List[str]:
+        """
+        取得文章標籤名稱, 優先使用查詢時一併取得的結果
+        """
+        tag_names = getattr(post, 'tag_names', None)
+        if tag_names is not None:
+            return list(tag_names)
+        return list(
+            TagManagement.objects.filter(post=post)
+            .order_by('id')
+            .values_list('tag__name', flat=True)
+        )
 
-class GetPostService:
     @staticmethod
-    def _check_post_visibility(post: Post, user: AbstractUser | None = None) -> bool:
+    def _check_post_visibility(
+        post: Post, user: AbstractUser | None = None, is_following: bool | None = None
+    ) -> bool:
         """
         檢查文章的可見性
+        :param is_following: 已知讀者是否追蹤作者時傳入, 可以省去一次查詢
         """
         # 公開文章所有人都可以看
         if post.visibility == 'public':
@@ -91,10 +230,9 @@ class GetPostService:
 
         # 只限追蹤者的文章
         if post.visibility == 'followers':
-            return Follow.objects.filter(
-                follower=user,
-                following=post.author,
-            ).exists()
+            if is_following is not None:
+                return is_following
+            return FollowGraphCache.is_following(user.id, post.author_id)
 
         # 只限會員的文章(已登入即可)
         if post.visibility == 'members':
@@ -102,13 +240,66 @@ class GetPostService:
 
         return False
 
+    @staticmethod
+    def filter_visible(
+        rows: List[Dict[str, Any]], user: AbstractUser | None = None
+    ) -> List[Dict[str, Any]]:
+        """
+        以同一個讀者批次過濾文章列表, 只做記憶體中的集合判斷
+        :param rows: 含 visibility 與 author_id 的文章資料, 例如 project_post_list 的結果
+        """
+        if not user:
+            return [row for row in rows if row['visibility'] == 'public']
+
+        following_ids = FollowGraphCache.get_following_ids(user.id)
+        visible = []
+        for row in rows:
+            visibility = row['visibility']
+            if (
+                visibility in ('public', 'members')
+                or row['author_id'] == user.id
+                or (visibility == 'followers' and row['author_id'] in following_ids)
+            ):
+                visible.append(row)
+        return visible
+
 
-def get_post_list(limit: int = 10) -> List[Dict[str, Any]]:
+# 文章列表需要的欄位, 不載入 content 與作者的密碼, 簡介等欄位
+POST_LIST_FIELDS = (
+    'id',
+    'title',
+    'summery',
+    'thumbnail_url',
+    'created_at',
+    'updated_at',
+    'visibility',
+    'author_id',
+    'like_count',
+    'bookmark_count',
+    'comment_count',
+)
+
+
+def project_post_list(
+    queryset: QuerySet[Post], *extra_fields: str
+) -> QuerySet[Dict[str, Any]]:
     """
-    獲取文章列表
+    只查詢 PostListOut 需要的欄位, 回傳 dict 而不是 model 實例
+    :param extra_fields: 額外需要的欄位, 例如分頁用的排序欄位
     """
-    return (
-        Post.objects.filter(status='published')
-        .select_related('author')
-        .order_by('-updated_at;')[:limit]
+    return queryset.values(
+        *POST_LIST_FIELDS,
+        *extra_fields,
+        author_name=F('author__username'),
+        author_avatar=F('author__avatar'),
+        reading_time=F('content_meta__reading_time'),
     )
+
+
+def get_post_list(limit: int = 10) -> QuerySet[Dict[str, Any]]:
+    """
+    獲取文章列表
+    """
+    return project_post_list(
+        Post.objects.filter(status='published').order_by('-updated_at')
+    )[:limit]
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Tag
+from .tag_index import TagSuggestIndex
+
+
+@receiver(post_save, sender=Tag)
+def index_new_tag(sender: object, instance: Tag, created: bool, **kwargs):
+    """
+    新增或改名的標籤, 加入自動完成索引
+    """
+    TagSuggestIndex.add_tag(instance)
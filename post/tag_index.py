@@ -0,0 +1,242 @@
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from post.models import Tag
+
+# 每個前綴節點保留的候選標籤數
+TOP_K = 20
+
+
+class _TrieNode:
+    __slots__ = ('children', 'top')
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _TrieNode] = {}
+        self.top: List[int] = []  # 使用次數最高的標籤 id
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize('NFKC', text).strip().lower()
+
+
+class TagSuggestIndex:
+    """
+    標籤自動完成的前綴索引 (trie), 存在每個 process 的記憶體中
+    - 以標籤名稱與 slug 建立前綴, 中文前綴也適用
+    - 每個節點保留使用次數最高的 TOP_K 個標籤, 查詢只需要走過前綴的長度
+    - 新增或改名的標籤在 commit 後增量插入, 並寫入共用的變更紀錄,
+      其他 process 依版本號取得缺少的變更增量套用, 不需要重新建立
+    - 使用次數減少時只更新權重, 由定期重建修正節點的候選名單
+    """
+
+    VERSION_KEY = 'post:tag-index:version'  # 最新的變更編號
+    CHANGE_KEY = 'post:tag-index:change:{version}'  # 每次變更的標籤
+    MAX_PENDING_CHANGES = 100  # 缺少的變更超過此數量時直接重新建立
+
+    _lock = threading.RLock()
+    _root: _TrieNode | None = None
+    _tags: Dict[int, Dict[str, Any]] = {}
+    _version: int | None = None
+    _built_at = 0.0
+    _checked_at = 0.0
+
+    @classmethod
+    def _rank(cls, tag_id: int) -> tuple:
+        tag = cls._tags[tag_id]
+        return (-tag['usage'], tag['name'])
+
+    @classmethod
+    def _insert(cls, tag_id: int) -> None:
+        tag = cls._tags[tag_id]
+        keys = {_normalize(tag['name']), _normalize(tag['slug'])}
+        visited = set()  # 名稱與 slug 共用前綴時, 同一個節點只處理一次
+
+        for key in keys:
+            node = cls._root
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+                if id(node) in visited:
+                    continue
+                visited.add(id(node))
+
+                if tag_id not in node.top:
+                    node.top.append(tag_id)
+                node.top.sort(key=cls._rank)
+                del node.top[TOP_K:]
+
+    @classmethod
+    def _remove(cls, tag_id: int) -> None:
+        # 從舊名稱與 slug 的前綴節點移除, 節點缺少的候選由定期重建補上
+        tag = cls._tags[tag_id]
+        for key in {_normalize(tag['name']), _normalize(tag['slug'])}:
+            node = cls._root
+            for char in key:
+                node = node.children.get(char)
+                if node is None:
+                    break
+                if tag_id in node.top:
+                    node.top.remove(tag_id)
+
+    @classmethod
+    def _apply(cls, entry: Dict[str, Any]) -> None:
+        """
+        插入新增或改名的標籤, 重複套用同一個變更的結果相同
+        """
+        old = cls._tags.get(entry['id'])
+        if old is not None:
+            cls._remove(entry['id'])
+        usage = old['usage'] if old is not None else 0
+        cls._tags[entry['id']] = {**entry, 'usage': usage}
+        cls._insert(entry['id'])
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """
+        從資料庫重新建立索引
+        - 先讀取版本再查詢, 查詢期間的變更之後會再套用一次
+        """
+        version = cache.get(cls.VERSION_KEY)
+        tags = list(
+            Tag.objects.annotate(usage=Count('tagmanagement')).values(
+                'id', 'name', 'slug', 'usage'
+            )
+        )
+        root = _TrieNode()
+        with cls._lock:
+            cls._root = root
+            cls._tags = {tag['id']: tag for tag in tags}
+            # 使用次數高的先插入, 節點排序的成本較低
+            for tag_id in sorted(cls._tags, key=lambda i: -cls._tags[i]['usage']):
+                cls._insert(tag_id)
+            cls._version = version
+            cls._built_at = cls._checked_at = time.monotonic()
+
+    @classmethod
+    def _sync(cls) -> None:
+        """
+        套用其他 process 的變更, 變更紀錄不完整時重新建立
+        """
+        version = cache.get(cls.VERSION_KEY)
+        local = cls._version
+        if version == local:
+            return
+        if (
+            version is None
+            or local is None
+            or version < local
+            or version - local > cls.MAX_PENDING_CHANGES
+        ):
+            cls.rebuild()
+            return
+
+        keys = [
+            cls.CHANGE_KEY.format(version=v) for v in range(local + 1, version + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            # 變更紀錄已過期, 或版本已遞增但紀錄還沒寫入
+            cls.rebuild()
+            return
+
+        with cls._lock:
+            if cls._version != local:
+                # 其他執行緒已經更新
+                return
+            for key in keys:
+                cls._apply(changes[key])
+            cls._version = version
+
+    @classmethod
+    def _ensure_fresh(cls) -> None:
+        """
+        索引不存在或太舊時重新建立, 其他 process 新增了標籤時增量套用
+        - 共用版本每秒最多檢查一次, 查詢時不需要每次連線快取
+        """
+        now = time.monotonic()
+        if cls._root is None:
+            cls.rebuild()
+            return
+        if now - cls._built_at > settings.TAG_SUGGEST_REBUILD_SECONDS:
+            cls.rebuild()
+            return
+        if now - cls._checked_at > 1:
+            cls._checked_at = now
+            cls._sync()
+
+    @classmethod
+    def suggest(cls, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        依前綴查詢標籤, 使用次數高的排前面
+        """
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+
+        cls._ensure_fresh()
+        with cls._lock:
+            node = cls._root
+            for char in prefix:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            return [dict(cls._tags[tag_id]) for tag_id in node.top[:limit]]
+
+    @classmethod
+    def _next_version(cls) -> int:
+        try:
+            return cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            # 版本 key 不存在, 從 0 開始
+            cache.add(cls.VERSION_KEY, 0, timeout=None)
+            return cache.incr(cls.VERSION_KEY)
+
+    @classmethod
+    def add_tag(cls, tag: Tag) -> None:
+        """
+        新增或改名的標籤, commit 後增量插入並寫入變更紀錄
+        - rollback 時不會加入索引, 改名時移除舊名稱的前綴
+        - 變更紀錄保留到所有 process 都會定期重建為止
+        """
+        entry = {'id': tag.id, 'name': tag.name, 'slug': tag.slug}
+
+        def apply() -> None:
+            with cls._lock:
+                if cls._root is not None:
+                    cls._apply(entry)
+
+            version = cls._next_version()
+            cache.set(
+                cls.CHANGE_KEY.format(version=version),
+                entry,
+                timeout=settings.TAG_SUGGEST_REBUILD_SECONDS,
+            )
+            with cls._lock:
+                # 中間沒有其他 process 的變更時, 自己已經是最新版本
+                if cls._version is not None and cls._version == version - 1:
+                    cls._version = version
+
+        transaction.on_commit(apply)
+
+    @classmethod
+    def add_usage(cls, tag_id: int, delta: int) -> None:
+        """
+        標籤使用次數變動, commit 後才更新
+        """
+
+        def apply() -> None:
+            with cls._lock:
+                tag = cls._tags.get(tag_id)
+                if cls._root is None or tag is None:
+                    return
+                tag['usage'] = max(0, tag['usage'] + delta)
+                if delta > 0:
+                    cls._insert(tag_id)
+
+        transaction.on_commit(apply)
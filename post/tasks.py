@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .autosave import DraftAutosaveService
+from .counters import PostCounter, ViewCounter
+from .draft_buffer import DraftWriteBuffer
+from .models import Post, PostContentStep
+from .related import RelatedPostIndex
+from .search import SearchIndexer
+from .trending import TrendingScore
+
+
+@shared_task
+def flush_view_counts() -> str:
+    """
+    Celery定時任務, 將 redis 緩衝的文章瀏覽數批次寫回資料庫
+    """
+    deltas = ViewCounter.flush()
+    if not deltas:
+        return '沒有需要寫回的瀏覽數'
+
+    print(f'已寫回 {len(deltas)} 篇文章的瀏覽數, 共 {sum(deltas.values())} 次')
+    return f'已寫回 {len(deltas)} 篇文章的瀏覽數'
+
+
+@shared_task
+def reconcile_post_counters() -> str:
+    """
+    Celery定時任務, 修正文章讚數, 收藏數, 留言數的誤差
+    """
+    fixed = PostCounter.reconcile()
+    print(f'修正 {fixed} 篇文章的計數')
+    return f'修正 {fixed} 篇文章的計數'
+
+
+@shared_task
+def rebuild_trending_scores() -> str:
+    """
+    Celery定時任務, 重新計算所有已發布文章的熱門分數
+    """
+    updated = TrendingScore.rebuild()
+    print(f'已重新計算 {updated} 篇文章的熱門分數')
+    return f'已重新計算 {updated} 篇文章的熱門分數'
+
+
+@shared_task
+def compact_post_content(post_id: int) -> str:
+    """
+    Celery任務, 將單篇文章累積的自動儲存 step 壓縮回 content
+    """
+    try:
+        compacted = DraftAutosaveService.compact(post_id)
+    except Post.DoesNotExist:
+        return f'文章 ID {post_id} 不存在'
+    return f'文章 {post_id} 已壓縮' if compacted else f'文章 {post_id} 不需要壓縮'
+
+
+@shared_task
+def compact_idle_drafts() -> str:
+    """
+    Celery定時任務, 壓縮一段時間沒有再自動儲存的草稿
+    """
+    idle_before = timezone.now() - timedelta(
+        seconds=settings.AUTOSAVE_COMPACT_IDLE_SECONDS
+    )
+    post_ids = list(
+        Post.objects.filter(draft_version__gt=F('content_version'))
+        .exclude(
+            id__in=PostContentStep.objects.filter(
+                created_at__gt=idle_before
+            ).values('post_id')
+        )
+        .values_list('id', flat=True)
+    )
+    compacted = 0
+    for post_id in post_ids:
+        try:
+            DraftAutosaveService.compact(post_id)
+        except Post.DoesNotExist:
+            # 查詢 id 之後文章被刪除, 略過繼續處理其他草稿
+            continue
+        compacted += 1
+
+    return f'已壓縮 {compacted} 篇草稿'
+
+
+@shared_task
+def flush_draft_buffers() -> str:
+    """
+    Celery定時任務, 將緩衝區的草稿寫回資料庫
+    """
+    written = DraftWriteBuffer.flush_all()
+    return f'已寫回 {written} 篇草稿'
+
+
+@shared_task
+def update_post_search_index(post_id: int) -> str:
+    """
+    Celery任務, 文章發布或修改後更新全文檢索索引
+    """
+    if SearchIndexer.index_post(post_id):
+        return f'文章 {post_id} 已更新索引'
+    return f'文章 {post_id} 已移除索引'
+
+
+@shared_task
+def refresh_related_posts(post_id: int) -> str:
+    """
+    Celery任務, 文章標籤變動後增量更新相似文章
+    """
+    refreshed = RelatedPostIndex.refresh(post_id)
+    return f'文章 {post_id} 標籤變動, 重新計算 {refreshed} 篇文章的相似文章'
+
+
+@shared_task
+def rebuild_related_posts() -> str:
+    """
+    Celery定時任務, 重新計算所有文章的相似文章
+    """
+    total = RelatedPostIndex.rebuild()
+    print(f'已重新計算 {total} 篇文章的相似文章')
+    return f'已重新計算 {total} 篇文章的相似文章'
@@ -1,3 +1,313 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from ninja.errors import HttpError
+
+from core.feed_cache import serialize_post_list
+from core.service import PostService
+from user.models import Follow, User
+from user.services import FollowGraphCache
+from YiyuanBlog.auth import generate_access_token
+
+from .autosave import DraftAutosaveService
+from .json_patch import JsonPatchError, apply_patch
+from .models import Post, PostContentStep, Tag, TagManagement
+from .schemas import PostListOut
+from .services import project_post_list
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+# PostgreSQL 以陣列子查詢一併取得標籤名稱, 其他資料庫另外查詢一次
+TAG_QUERIES = 0 if connection.vendor == 'postgresql' else 1
+
+
+def _create_post(author: User, title: str, tag_count: int = 3, **kwargs) -> Post:
+    post = Post.objects.create(
+        author=author,
+        title=title,
+        content={'type': 'doc', 'content': []},
+        status='published',
+        **kwargs,
+    )
+    for i in range(tag_count):
+        tag, _ = Tag.objects.get_or_create(slug=f'tag-{i}', defaults={'name': f'標籤{i}'})
+        TagManagement.objects.create(post=post, tag=tag)
+    return post
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PostDetailQueryCountTests(TestCase):
+    """
+    單篇文章只需要一次查詢, 避免 N+1 回歸
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='author@example.com', username='author', is_active=True
+        )
+        cls.reader = User.objects.create(
+            email='reader@example.com', username='reader', is_active=True
+        )
+        Follow.objects.create(follower=cls.reader, following=cls.author)
+        cls.public_post = _create_post(cls.author, '公開文章')
+        cls.followers_post = _create_post(
+            cls.author, '追蹤者限定', tag_count=5, visibility='followers'
+        )
+
+    def setUp(self):
+        cache.clear()
+        # 瀏覽數緩衝在 redis, 不在這裡測試
+        patcher = mock.patch('post.api.ViewCounter.incr', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_anonymous_detail_query_count(self):
+        url = f'/api/post/{self.public_post.id}/'
+        self.client.get(url)  # 載入內容快取
+
+        with self.assertNumQueries(1 + TAG_QUERIES):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['tags']), 3)
+
+    def test_followers_only_detail_query_count(self):
+        url = f'/api/post/{self.followers_post.id}/'
+        token = generate_access_token(self.reader.id, self.reader.email)
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        self.client.get(url, **headers)  # 載入內容與使用者快取
+
+        # 追蹤關係與追蹤者數量都在同一次查詢中
+        with self.assertNumQueries(1 + TAG_QUERIES):
+            response = self.client.get(url, **headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['tags']), 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PostListQueryCountTests(TestCase):
+    """
+    文章列表的查詢數量不隨文章數與標籤數增加
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(
+            email='reader@example.com', username='reader', is_active=True
+        )
+        for i in range(8):
+            author = User.objects.create(
+                email=f'author{i}@example.com', username=f'author{i}', is_active=True
+            )
+            _create_post(author, f'文章{i}', visibility=('public', 'members')[i % 2])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_homepage_query_count(self):
+        with self.assertNumQueries(1):
+            posts, _ = PostService.get_homepage_posts(user=None, limit=6)
+        self.assertEqual(len(posts), 4)
+
+    def test_member_homepage_query_count(self):
+        FollowGraphCache.get_following_ids(self.reader.id)  # 載入追蹤名單快取
+
+        with self.assertNumQueries(1):
+            posts, next_cursor = PostService.get_homepage_posts(
+                user=self.reader, limit=6
+            )
+        self.assertEqual(len(posts), 6)
+        self.assertIsNotNone(next_cursor)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PostListOutputTests(TestCase):
+    """
+    欄位投影後的列表輸出要和原本以 model 序列化的格式相同
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='author@example.com',
+            username='author',
+            is_active=True,
+            avatar='user_1/avatar/avatar.jpg',
+        )
+        cls.post = _create_post(cls.author, '公開文章', tag_count=0)
+
+    def test_author_avatar_is_url(self):
+        row = project_post_list(Post.objects.filter(id=self.post.id)).get()
+        # 原本由 ninja 把 ImageField 轉成 .url, 投影後仍然回傳相同的網址
+        self.assertEqual(
+            PostListOut.model_validate(row).author_avatar, self.author.avatar.url
+        )
+        self.assertIn(
+            f'"author_avatar": "{self.author.avatar.url}"',
+            serialize_post_list([row]).decode(),
+        )
+
+    def test_missing_avatar_is_null(self):
+        self.author.avatar = None
+        self.author.save()
+
+        row = project_post_list(Post.objects.filter(id=self.post.id)).get()
+        self.assertIsNone(PostListOut.model_validate(row).author_avatar)
+
+
+class JsonPatchTests(SimpleTestCase):
+    """
+    RFC 6902 的各種操作
+    """
+
+    def setUp(self):
+        self.document = {'type': 'doc', 'content': [{'text': 'a'}, {'text': 'b'}]}
+
+    def test_add(self):
+        result = apply_patch(
+            self.document,
+            [
+                {'op': 'add', 'path': '/attrs', 'value': {'lang': 'zh'}},
+                {'op': 'add', 'path': '/content/1', 'value': {'text': 'x'}},
+            ],
+        )
+        self.assertEqual(result['attrs'], {'lang': 'zh'})
+        self.assertEqual([node['text'] for node in result['content']], ['a', 'x', 'b'])
+
+    def test_add_to_array_end(self):
+        result = apply_patch(
+            self.document, [{'op': 'add', 'path': '/content/-', 'value': {'text': 'c'}}]
+        )
+        self.assertEqual([node['text'] for node in result['content']], ['a', 'b', 'c'])
+
+    def test_remove(self):
+        result = apply_patch(self.document, [{'op': 'remove', 'path': '/content/0'}])
+        self.assertEqual(result['content'], [{'text': 'b'}])
+
+    def test_replace(self):
+        result = apply_patch(
+            self.document, [{'op': 'replace', 'path': '/content/1/text', 'value': 'y'}]
+        )
+        self.assertEqual(result['content'][1], {'text': 'y'})
+
+    def test_move(self):
+        result = apply_patch(
+            self.document, [{'op': 'move', 'from': '/content/0', 'path': '/content/-'}]
+        )
+        self.assertEqual([node['text'] for node in result['content']], ['b', 'a'])
+
+    def test_test_operation(self):
+        patch = [{'op': 'test', 'path': '/content/0/text', 'value': 'a'}]
+        self.assertEqual(apply_patch(self.document, patch), self.document)
+
+        with self.assertRaises(JsonPatchError):
+            apply_patch(
+                self.document, [{'op': 'test', 'path': '/content/0/text', 'value': 'z'}]
+            )
+
+    def test_failed_patch_does_not_modify_document(self):
+        with self.assertRaises(JsonPatchError):
+            apply_patch(
+                self.document,
+                [
+                    {'op': 'remove', 'path': '/content/0'},
+                    {'op': 'replace', 'path': '/content/5', 'value': {}},
+                ],
+            )
+        self.assertEqual(len(self.document['content']), 2)
+
+    def test_invalid_paths(self):
+        for operation in (
+            {'op': 'remove', 'path': '/missing'},
+            {'op': 'add', 'path': '/content/3', 'value': {}},
+            {'op': 'remove', 'path': '/content/-'},
+            {'op': 'replace', 'path': 'content', 'value': {}},
+            {'op': 'move', 'from': '/content', 'path': '/content/0'},
+        ):
+            with self.subTest(operation=operation):
+                with self.assertRaises(JsonPatchError):
+                    apply_patch(self.document, [operation])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DraftAutosaveTests(TestCase):
+    """
+    增量自動儲存的版本檢查與壓縮
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='author@example.com', username='author', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.author,
+            title='草稿',
+            content={'type': 'doc', 'content': []},
+        )
+
+    def _append(self, base_version: int, text: str) -> int:
+        return DraftAutosaveService.apply_steps(
+            self.post,
+            base_version,
+            [{'op': 'add', 'path': '/content/-', 'value': {'text': text}}],
+        )
+
+    def test_apply_steps(self):
+        self.assertEqual(self._append(0, 'a'), 1)
+        self.assertEqual(self._append(1, 'b'), 2)
+
+        post = Post.objects.get(id=self.post.id)
+        self.assertEqual(post.draft_version, 2)
+        self.assertEqual(post.content_version, 0)
+        self.assertEqual(
+            DraftAutosaveService.get_draft(post)['content'],
+            [{'text': 'a'}, {'text': 'b'}],
+        )
+
+    def test_stale_base_version_conflict(self):
+        self._append(0, 'a')
+
+        with self.assertRaises(HttpError) as ctx:
+            self._append(0, 'b')
+        self.assertEqual(ctx.exception.status_code, 409)
+        self.assertEqual(PostContentStep.objects.filter(post=self.post).count(), 1)
+
+    def test_concurrent_update_conflict(self):
+        # 其他請求已經寫入同一個版本, 記憶體中的 post 仍是舊的版本
+        Post.objects.filter(id=self.post.id).update(draft_version=1)
+
+        with self.assertRaises(HttpError) as ctx:
+            self._append(0, 'a')
+        self.assertEqual(ctx.exception.status_code, 409)
+
+    def test_invalid_patch_rejected(self):
+        with self.assertRaises(HttpError) as ctx:
+            DraftAutosaveService.apply_steps(
+                self.post, 0, [{'op': 'remove', 'path': '/content/0'}]
+            )
+        self.assertEqual(ctx.exception.status_code, 422)
+        self.assertEqual(Post.objects.get(id=self.post.id).draft_version, 0)
+
+    def test_compact(self):
+        self._append(0, 'a')
+        self._append(1, 'b')
+        cache.clear()  # 壓縮時從 step 重新套用
+
+        self.assertTrue(DraftAutosaveService.compact(self.post.id))
+
+        post = Post.objects.get(id=self.post.id)
+        self.assertEqual(post.content_version, 2)
+        self.assertEqual(post.content['content'], [{'text': 'a'}, {'text': 'b'}])
+        self.assertFalse(PostContentStep.objects.filter(post=post).exists())
+        # 沒有新的 step 時不需要壓縮
+        self.assertFalse(DraftAutosaveService.compact(self.post.id))
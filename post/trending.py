@@ -0,0 +1,171 @@
+import math
+from datetime import date, datetime, time
+from datetime import timezone as dt_timezone
+from typing import Dict, Iterable, List, Sequence
+
+from django.conf import settings
+from django.db.models import Case, Expression, F, FloatField, Value, When
+from django.db.models.functions import Greatest, Least, Log, Power
+from django.utils import timezone
+
+from comment.models import Comment
+from post.models import Bookmark, Like, Post
+
+# 分數的時間原點, 分數只用來比較大小, 原點可以是任意固定時間
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+# 各種互動的權重
+WEIGHTS = {
+    'publish': 10.0,
+    'view': 1.0,
+    'like_count': 4.0,
+    'bookmark_count': 6.0,
+    'comment_count': 8.0,
+}
+
+# 重建時每次 bulk_update 的文章數
+REBUILD_BATCH_SIZE = 500
+
+# log-sum-exp 中較小一方的指數下限, 2^-64 相對於較大一方可以忽略
+# PostgreSQL 的 pow() 在結果過小時會拋出 underflow, 不會回傳 0
+MIN_EXPONENT_GAP = -64.0
+
+
+class TrendingScore:
+    """
+    文章的熱門分數, 互動依時間指數衰減
+    - forward decay: 每次互動加上 weight * 2^((t - EPOCH) / half_life)
+      越新的互動貢獻越大, 排序結果等同於所有互動都隨時間衰減, 但不需要定期重算
+    - 欄位存的是 log2(分數) 避免溢位, 累加時使用 log-sum-exp
+    - 互動以資料的建立時間計分, 取消時扣掉同樣的值, 反覆切換不會累積分數
+    - 0 表示還沒有任何分數, 第一次發布時直接設為發布的貢獻值
+    - 浮點誤差造成的漂移由每日重建修正
+    """
+
+    @staticmethod
+    def exponent(weight: float, at: datetime | date | None = None) -> float:
+        """
+        一次互動在 log2 空間的貢獻值
+        """
+        at = at or timezone.now()
+        if not isinstance(at, datetime):
+            # 讚只有日期, 當作當天開始
+            at = datetime.combine(at, time.min, tzinfo=dt_timezone.utc)
+        half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+        return math.log2(weight) + (at - EPOCH).total_seconds() / half_life
+
+    @staticmethod
+    def log_sum(values: Sequence[float]) -> float:
+        """
+        log2(sum(2^value)), 先減去最大值避免溢位
+        """
+        high = max(values)
+        return high + math.log2(sum(2 ** (value - high) for value in values))
+
+    @classmethod
+    def total_exponent(cls, kind: str, created: Iterable[datetime | date]) -> float:
+        """
+        多次互動合計的貢獻值
+        :param kind: WEIGHTS 中的互動種類
+        :param created: 每次互動的建立時間
+        """
+        return cls.log_sum([cls.exponent(WEIGHTS[kind], at) for at in created])
+
+    @staticmethod
+    def log_add(current: Expression, exponent: Expression) -> Expression:
+        """
+        log2(2^current + 2^exponent) 的 SQL 運算式
+        - 先取較大值, 指數部分永遠不大於 0, 不會溢位
+        - 指數差距不小於 MIN_EXPONENT_GAP, 避免 pow() underflow
+        """
+        high = Greatest(current, exponent, output_field=FloatField())
+        low = Least(current, exponent, output_field=FloatField())
+        gap = Greatest(low - high, Value(MIN_EXPONENT_GAP), output_field=FloatField())
+        return high + Log(
+            Value(2.0),
+            Value(1.0) + Power(Value(2.0), gap),
+            output_field=FloatField(),
+        )
+
+    @staticmethod
+    def log_sub(current: Expression, exponent: Expression) -> Expression:
+        """
+        log2(2^current - 2^exponent) 的 SQL 運算式
+        - 扣掉的值不小於現有分數時(浮點誤差), 結果是 current + MIN_EXPONENT_GAP,
+          相對於其他文章等同於沒有分數
+        """
+        gap = Greatest(
+            Least(exponent - current, Value(0.0), output_field=FloatField()),
+            Value(MIN_EXPONENT_GAP),
+            output_field=FloatField(),
+        )
+        remaining = Greatest(
+            Value(1.0) - Power(Value(2.0), gap),
+            Value(2.0**MIN_EXPONENT_GAP),
+            output_field=FloatField(),
+        )
+        return current + Log(Value(2.0), remaining, output_field=FloatField())
+
+    @classmethod
+    def publish(cls, post_id: int) -> None:
+        """
+        文章第一次發布, 加上發布的貢獻值
+        - 還沒有分數的文章直接設為發布的貢獻值, 不和預設的 0 相加
+        """
+        exponent = Value(cls.exponent(WEIGHTS['publish']))
+        Post.objects.filter(id=post_id).update(
+            trending_score=Case(
+                When(trending_score=0, then=exponent),
+                default=cls.log_add(F('trending_score'), exponent),
+                output_field=FloatField(),
+            )
+        )
+
+    @classmethod
+    def _post_exponents(cls) -> Dict[int, List[float]]:
+        exponents: Dict[int, List[float]] = {}
+
+        def collect(kind: str, rows: Iterable[tuple[int, datetime | date]]) -> None:
+            for post_id, at in rows:
+                exponents.setdefault(post_id, []).append(
+                    cls.exponent(WEIGHTS[kind], at)
+                )
+
+        published = Post.objects.filter(status='published')
+        collect('publish', published.values_list('id', 'created_at').iterator())
+
+        # 瀏覽沒有時間紀錄, 視為發布時一次發生
+        for post_id, created_at, views in published.filter(
+            views_count__gt=0
+        ).values_list('id', 'created_at', 'views_count').iterator():
+            exponents.setdefault(post_id, []).append(
+                cls.exponent(WEIGHTS['view'] * views, created_at)
+            )
+
+        for kind, model in (
+            ('like_count', Like),
+            ('bookmark_count', Bookmark),
+            ('comment_count', Comment),
+        ):
+            collect(
+                kind,
+                model.objects.filter(post__status='published')
+                .values_list('post_id', 'created_at')
+                .iterator(),
+            )
+        return exponents
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """
+        從讚, 收藏, 留言與瀏覽數重新計算所有已發布文章的分數
+        :return: 更新的文章數
+        """
+        posts = []
+        for post_id, values in cls._post_exponents().items():
+            posts.append(Post(id=post_id, trending_score=cls.log_sum(values)))
+
+        Post.objects.bulk_update(
+            posts, ['trending_score'], batch_size=REBUILD_BATCH_SIZE
+        )
+        return len(posts)
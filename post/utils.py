@@ -8,11 +8,13 @@ from ninja import UploadedFile
 from ninja.errors import HttpError
 from PIL import Image
 
+from post.cache import PostDetailCache
 from post.models import (
     Post,
     Tag,
     TagManagement,
 )
+from post.tag_index import TagSuggestIndex
 
 # 上傳圖片限制
 ALLOWED_IMAGE_FORMATS = {'image/jpeg', 'image/jpg', 'image/png'}
@@ -22,34 +24,84 @@ ALLOWED_VIDEO_FORMATS = {'video/mp4'}
 MAX_VIDEO_SIZE = 1024 * 1024 * 500  # 500MB
 
 
-def get_or_create_tag(tag_text: str) -> Tag:
+def update_post_tags(post: Post, tag_list: list[str]) -> tuple[set[int], set[int]]:
     """
-    根據 tag 名稱取得或建立 Tag 物件
+    以差異方式更新文章標籤, 只新增缺少的連結並刪除被移除的連結
+    查詢次數固定, 不隨標籤數量增加
+    標籤依連結的 id 排序顯示, 連結的順序和傳入的順序相同
+    :return: (新增的 tag id, 移除的 tag id)
     """
-    slug = slugify(tag_text, allow_unicode=True)
-    tag, created = Tag.objects.get_or_create(
-        slug=slug,
-        defaults={'name': tag_text},
+    # slug -> 名稱, 保留第一次出現的順序, 同一個 slug 以最後出現的名稱為準
+    wanted: dict[str, str] = {}
+    for tag_text in tag_list:
+        slug = slugify(tag_text, allow_unicode=True)
+        if slug:
+            wanted[slug] = tag_text
+
+    # 一次查出所有已存在的標籤, 缺少的批次建立
+    tags = {tag.slug: tag for tag in Tag.objects.filter(slug__in=wanted)}
+    created_slugs = wanted.keys() - tags.keys()
+    if created_slugs:
+        # 並發發布可能同時建立相同 slug, 衝突時忽略後重新查詢取得 id
+        Tag.objects.bulk_create(
+            [Tag(slug=slug, name=wanted[slug]) for slug in created_slugs],
+            ignore_conflicts=True,
+        )
+        tags = {tag.slug: tag for tag in Tag.objects.filter(slug__in=wanted)}
+
+    # 標籤名稱不同則改名
+    renamed = []
+    for slug, tag in tags.items():
+        if tag.name != wanted[slug]:
+            tag.name = wanted[slug]
+            renamed.append(tag)
+    if renamed:
+        Tag.objects.bulk_update(renamed, ['name'])
+
+    old_tag_ids = list(
+        TagManagement.objects.filter(post=post)
+        .order_by('id')
+        .values_list('tag_id', flat=True)
     )
+    new_tag_ids = [tags[slug].id for slug in wanted]
+    added = set(new_tag_ids) - set(old_tag_ids)
+    removed = set(old_tag_ids) - set(new_tag_ids)
+
+    # 保留的連結依原本順序, 新增的接在後面, 和傳入的順序相同時只處理差異
+    kept = [tag_id for tag_id in old_tag_ids if tag_id not in removed]
+    appended = [tag_id for tag_id in new_tag_ids if tag_id in added]
+    if kept + appended == new_tag_ids:
+        if removed:
+            TagManagement.objects.filter(post=post, tag_id__in=removed).delete()
+        link_ids = appended
+    else:
+        # 順序改變, 依傳入的順序重建所有連結
+        TagManagement.objects.filter(post=post).delete()
+        link_ids = new_tag_ids
+    if link_ids:
+        TagManagement.objects.bulk_create(
+            [TagManagement(post=post, tag_id=tag_id) for tag_id in link_ids],
+            ignore_conflicts=True,
+        )
 
-    # 如果標籤名稱與 slug 不同，則更新標籤名稱
-    # 若有找到 = False 且標籤名稱不同，則更新標籤名稱
-    if not created and tag.name != tag_text:
-        tag.name = tag_text
-        tag.save()
-    return tag
-
-
-def update_post_tags(post: Post, tag_list: list[str]) -> None:
-    """
-    清除原有標籤, 並根據給定 tag list 更新文章標籤
-    """
-    # 清除現有標籤
-    TagManagement.objects.filter(post=post).delete()
+    # 批次操作不會觸發 post_save, 自行更新自動完成索引
+    for slug in created_slugs | {tag.slug for tag in renamed}:
+        TagSuggestIndex.add_tag(tags[slug])
+    for tag_id in added:
+        TagSuggestIndex.add_usage(tag_id, 1)
+    for tag_id in removed:
+        TagSuggestIndex.add_usage(tag_id, -1)
+
+    # 標籤改名會影響所有使用此標籤的文章, 遞增內容版本讓 ETag 改變
+    if renamed:
+        PostDetailCache.invalidate(
+            *TagManagement.objects.filter(tag__in=renamed)
+            .values_list('post_id', flat=True)
+            .distinct()
+        )
+    PostDetailCache.invalidate(post.id)
 
-    for tag_text in tag_list:
-        tag = get_or_create_tag(tag_text)
-        TagManagement.objects.create(post=post, tag=tag)
+    return added, removed
 
 
 def is_valid_image(file: UploadedFile) -> tuple[bool, str]:
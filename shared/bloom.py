@@ -0,0 +1,43 @@
+import hashlib
+import math
+from typing import Iterable
+
+
+class BloomFilter:
+    """
+    Bloom filter, 判斷元素「一定不在」或「可能在」集合中
+    - 不會有偽陰性, 偽陽性機率約為 error_rate
+    - 以 bytearray 儲存位元, 兩個雜湊值組合出 k 個位置 (double hashing)
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        capacity = max(capacity, 1)
+        bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(8, math.ceil(bits))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_items(
+        cls, items: Iterable[str], capacity: int, error_rate: float = 0.01
+    ) -> 'BloomFilter':
+        bloom = cls(capacity, error_rate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
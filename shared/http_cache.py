@@ -0,0 +1,67 @@
+import hashlib
+from datetime import datetime
+from typing import Any
+
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+
+def make_weak_etag(*parts: Any) -> str:
+    """
+    由多個欄位產生弱 ETag
+    - 弱 ETag 代表語意相同, 例如瀏覽數變動不會讓 ETag 失效
+    """
+    raw = '|'.join(str(part) for part in parts)
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _opaque_tag(etag: str) -> str:
+    # 弱比較只比對引號內的值
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def is_not_modified(
+    request: HttpRequest, etag: str, last_modified: datetime | None = None
+) -> bool:
+    """
+    判斷用戶端的快取是否仍然有效
+    - 有 If-None-Match 時只看 ETag, 否則才看 If-Modified-Since
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        client_tags = {_opaque_tag(tag) for tag in if_none_match.split(',')}
+        return '*' in client_tags or _opaque_tag(etag) in client_tags
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(last_modified.timestamp()) <= since
+
+    return False
+
+
+def set_validators(
+    response: HttpResponse, etag: str, last_modified: datetime | None = None
+) -> None:
+    """
+    在回應加上 ETag / Last-Modified
+    - 回應內容依登入者而不同, 所以要 Vary: Authorization
+    - no-cache 代表用戶端可以保存, 但每次都要帶驗證器回來確認
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ['Authorization'])
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+def not_modified(etag: str, last_modified: datetime | None = None) -> HttpResponse:
+    """
+    產生 304 回應, 不需要序列化內容
+    """
+    response = HttpResponse(status=304)
+    set_validators(response, etag, last_modified)
+    return response
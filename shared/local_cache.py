@@ -0,0 +1,47 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LocalTTLCache:
+    """
+    process 內的 LRU 快取, 每筆資料有存活時間
+    - 超過 maxsize 時淘汰最久沒有使用的資料
+    - 只存在單一 process, 其他 process 的修改要等 ttl 過期才會看到
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, self._MISSING)
+            if item is self._MISSING:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
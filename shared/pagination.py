@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, List
+
+from django.db.models import Q, QuerySet
+from ninja.errors import HttpError
+
+# 下一頁游標放在回應標頭, 列表本身維持原本的 schema
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(value: datetime | float, pk: int) -> str:
+    """
+    將 (排序欄位的值, id) 編碼成不透明的游標字串
+    """
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(
+    cursor: str, value_type: type = datetime
+) -> tuple[datetime | float, int]:
+    """
+    解析游標, 格式錯誤時回傳 400
+    :param value_type: 排序欄位的型別, datetime 或 float
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded))
+        if value_type is datetime:
+            return datetime.fromisoformat(value), int(pk)
+        return float(value), int(pk)
+    except (binascii.Error, ValueError, TypeError):
+        raise HttpError(400, '無效的分頁游標')
+
+
+def keyset_paginate(
+    queryset: QuerySet,
+    cursor: str | None,
+    limit: int,
+    field: str = 'created_at',
+    value_type: type = datetime,
+) -> tuple[List[Dict[str, Any]], str | None]:
+    """
+    以 (field, id) 遞減排序做 keyset 分頁, 不使用 OFFSET
+    - 每一頁都是從索引上的游標位置往後讀 limit 筆, 深頁和第一頁成本相同
+    - queryset 需要是 values() 查詢且包含 id 與 field
+    :param field: 排序欄位, 預設為 created_at
+    :param value_type: 排序欄位的型別, datetime 或 float
+    :return: (這一頁的資料, 下一頁游標, 沒有下一頁時為 None)
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    if cursor:
+        value, pk = decode_cursor(cursor, value_type)
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+        )
+
+    # 多讀一筆判斷是否還有下一頁
+    rows = list(queryset[: limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[field], last['id'])
@@ -0,0 +1,16 @@
+import redis
+from django.conf import settings
+
+_client: redis.Redis | None = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    取得共用的 redis 連線
+    - 計數器, 緩衝區等需要跨 worker 共享的資料都放在這裡
+    - 連線池由 redis-py 管理, 每個 process 只建立一次
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
@@ -0,0 +1,90 @@
+import math
+import random
+import time
+from typing import Any, Callable
+
+from django.core.cache import cache
+
+# 沒有舊資料又拿不到鎖時, 等待重建結果的時間(秒)與輪詢間隔
+LOCK_WAIT_SECONDS = 1.0
+LOCK_POLL_SECONDS = 0.05
+
+
+class SoftTTLCache:
+    """
+    防止快取雪崩的讀取快取
+    - soft TTL: 過期後仍保留舊資料到 hard TTL, 重建期間其他請求直接回傳舊資料
+    - single-flight: 以 cache.add 取得重建鎖, 同一時間只有一個 worker 重新計算
+    - 機率性提前重建 (XFetch): 越接近過期, 重建所需時間越長, 越可能提前重建,
+      避免大量請求在同一瞬間同時看到過期
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        soft_ttl: float,
+        hard_ttl: float,
+        beta: float = 1.0,
+        lock_timeout: int = 10,
+    ) -> None:
+        self.prefix = prefix
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.beta = beta
+        self.lock_timeout = lock_timeout
+
+    def _should_refresh(self, entry: dict, now: float) -> bool:
+        # now - delta * beta * ln(rand) >= expires_at, ln(rand) <= 0
+        jitter = entry['delta'] * self.beta * math.log(1.0 - random.random())
+        return now - jitter >= entry['expires_at']
+
+    def _compute_and_store(self, key: str, compute: Callable[[], Any]) -> Any:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        entry = {
+            'value': value,
+            'delta': delta,
+            'expires_at': time.time() + self.soft_ttl,
+        }
+        cache.set(key, entry, timeout=self.hard_ttl)
+        return value
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        讀取快取, 需要時重新計算
+        :param compute: 重新計算的函式, 回傳值必須可以被快取序列化
+        """
+        cache_key = f'{self.prefix}:{key}'
+        entry = cache.get(cache_key)
+        if entry is not None and not self._should_refresh(entry, time.time()):
+            return entry['value']
+
+        lock_key = f'{cache_key}:lock'
+        if cache.add(lock_key, 1, timeout=self.lock_timeout):
+            try:
+                return self._compute_and_store(cache_key, compute)
+            finally:
+                cache.delete(lock_key)
+
+        # 其他 worker 正在重建, 有舊資料就先回傳舊資料
+        if entry is not None:
+            return entry['value']
+
+        # 完全沒有資料, 等待重建結果, 等不到才自己計算 (不寫入快取)
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_SECONDS)
+            entry = cache.get(cache_key)
+            if entry is not None:
+                return entry['value']
+        return compute()
+
+    def refresh(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        立即重新計算並寫入快取, 定時任務預先建立時使用
+        """
+        return self._compute_and_store(f'{self.prefix}:{key}', compute)
+
+    def delete(self, key: str) -> None:
+        cache.delete(f'{self.prefix}:{key}')
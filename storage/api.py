@@ -1,8 +1,10 @@
 from django.http import HttpRequest
-from django.shortcuts import get_object_or_404
+from django.shortcuts import aget_object_or_404, get_object_or_404
 from ninja import Router
 from ninja.errors import HttpError
 
+from YiyuanBlog.auth import AsyncJWTAuth
+
 from .models import Storage
 from .schemas import UpgradePlanIn
 
@@ -13,20 +15,24 @@ router = Router()
     path='info/',
     response={200: dict},
     summary='取得使用者儲存空間資訊',
+    auth=AsyncJWTAuth(),
 )
-def get_storage_info(request: HttpRequest) -> tuple[int, dict]:
+async def get_storage_info(request: HttpRequest) -> tuple[int, dict]:
     """
     取得使用者儲存空間資訊
+    - 非同步端點, 資料庫使用 async ORM
     """
-    print(f'User: {request.auth}')
-
     user = request.auth
 
+    # 只查詢需要的兩個欄位
+    storage = await aget_object_or_404(
+        Storage.objects.values('used_storage', 'storage_limit'), user=user
+    )
+
     # 取得用戶使用了多少儲存空間
-    used_bytes = user.storage_usage.used_storage
+    used_bytes = storage['used_storage']
     # 計算用戶的儲存空間上限
-    user_storage_limit = user.storage_usage.storage_limit
-    print(user.storage_usage.storage_limit)
+    user_storage_limit = storage['storage_limit']
 
     return 200, {
         'status': 'success',
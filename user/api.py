@@ -1,7 +1,7 @@
 from pathlib import Path
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.contrib.auth import authenticate
 from django.core.files.base import ContentFile
 from django.db import transaction
 from django.http import HttpRequest
@@ -9,15 +9,19 @@ from django.shortcuts import get_object_or_404
 from ninja import File, Router, UploadedFile
 from ninja.errors import HttpError
 
+from core.timeline import FollowerTimeline
 from shared.images_utils import (
     is_valid_image,
     rename_file,
 )
 from user.models import Follow, User
+from user.hashing import PasswordHashing
+from user.services import FollowGraphCache
 from user.schemas import (
     CreateUserRequest,
     FollowToggleOut,
     LoginRequest,
+    LogoutRequest,
     PrivateUserInfoOut,
     RefreshTokenRequest,
     UpdateUserInfoIn,
@@ -28,6 +32,7 @@ from YiyuanBlog.auth import (
     generate_access_token,
     generate_refresh_token,
     refreshed_token,
+    revoke_token,
 )
 
 SECRET_KEY = settings.SECRET_KEY
@@ -72,28 +77,29 @@ def get_current_user_info(request: HttpRequest) -> PrivateUserInfoOut:
     summary='新增使用者(註冊)',
     auth=None,
 )
-def register_user(request: HttpRequest, payload: CreateUserRequest) -> tuple[int, dict]:
+async def register_user(
+    request: HttpRequest, payload: CreateUserRequest
+) -> tuple[int, dict]:
     """
     新增使用者(註冊)
+    - 非同步端點, 雜湊密碼時 worker 可以繼續處理其他請求
     """
     # 檢查 email 是否已存在
-    if User.objects.filter(email=payload.email).exists():
+    if await User.objects.filter(email=payload.email).aexists():
         raise HttpError(409, '使用者 email 已存在')
 
-    user = User.objects.create(
+    # 在執行緒池雜湊密碼, 建立時一併寫入
+    user = await User.objects.acreate(
         email=payload.email,
+        password=await PasswordHashing.amake_password(payload.password),
     )
 
-    # 使用 set_password() 設定密碼，這樣密碼會被加密
-    user.set_password(raw_password=payload.password)
-    user.save()
-
     # 發送驗證信
-    EmailVerificationService.send_verification_email(user)
+    await sync_to_async(EmailVerificationService.send_verification_email)(user)
     print('發送驗證信成功')
 
     # 創建使用者資料夾
-    create_user_folder(user.id)
+    await sync_to_async(create_user_folder)(user.id)
     print('創建使用者資料夾成功')
 
     return 201, {
@@ -108,16 +114,17 @@ def register_user(request: HttpRequest, payload: CreateUserRequest) -> tuple[int
     summary='使用者登入',
     auth=None,
 )
-def login_user(request: HttpRequest, payload: LoginRequest) -> tuple[int, dict]:
+async def login_user(request: HttpRequest, payload: LoginRequest) -> tuple[int, dict]:
     """
     登入使用者
+    - 非同步端點, 驗證密碼時 worker 可以繼續處理其他請求
     """
-    # django 內建的 authenticate() 方法
-    user = authenticate(request, email=payload.email, password=payload.password)
+    # 和 django 內建的 authenticate() 相同, 但在執行緒池驗證密碼
+    user = await PasswordHashing.aauthenticate(payload.email, payload.password)
 
     # 檢查資料庫有沒有輸入的帳號密碼
     if user is None:
-        return HttpError(401, '帳號或密碼錯誤')
+        raise HttpError(401, '帳號或密碼錯誤')
 
     # 帶 token 回傳
     access_token = generate_access_token(user.id, user.email)
@@ -135,10 +142,18 @@ def login_user(request: HttpRequest, payload: LoginRequest) -> tuple[int, dict]:
     response={200: dict},
     summary='使用者登出',
 )
-def logut_user(request: HttpRequest) -> dict[str, str]:
+def logut_user(
+    request: HttpRequest, payload: LogoutRequest | None = None
+) -> dict[str, str]:
     """
     登出使用者
+    - 撤銷目前的 access token, 有傳入 refresh token 時一併撤銷
     """
+    _, _, access_token = request.headers.get('Authorization', '').partition(' ')
+    revoke_token(access_token)
+    if payload is not None and payload.refresh_token:
+        revoke_token(payload.refresh_token)
+
     # 前端負責刪除 access token 和 refresh token
     return {
         'status': 'success',
@@ -223,8 +238,9 @@ def update_avatar(
     file_content = ContentFile(file.read(), name=new_filename)
 
     try:
-        # 儲存用戶新頭像
-        user.avatar.save(new_filename, file_content, save=True)
+        # 儲存用戶新頭像, request.auth 是快取的快照, 只寫回頭像欄位
+        user.avatar.save(new_filename, file_content, save=False)
+        user.save(update_fields=['avatar'])
         print(f'使用者 {user_id} 的頭像已更新: {user.avatar.url}')
 
         # 設定絕對路徑url, 給前端使用
@@ -264,7 +280,8 @@ def update_user_info(
     try:
         # 更新使用者資訊
         user.username = payload.nickname
-        user.save()
+        # request.auth 是快取的快照, 只寫回修改的欄位, 避免覆蓋其他 process 的修改
+        user.save(update_fields=['username'])
         print(f'使用者 {user_id} 的資訊已更新')
     except Exception as e:
         raise HttpError(400, f'無法更新使用者資訊: {e}')
@@ -316,6 +333,12 @@ def toggle_follow(request: HttpRequest, user_id: int) -> FollowToggleOut:
             is_following = False
             print(f'{follower.username} 取消追蹤了 {following.username}')
 
+        # 追蹤名單改變, 清除可見性判斷用的快取
+        FollowGraphCache.invalidate(follower.id)
+        # 新追蹤的作者已發布的文章不在時間軸中, 清除後重建
+        if is_following:
+            FollowerTimeline.invalidate(follower.id)
+
         # 重新計算追蹤數量
         follower_count = following.follower_relations.count()
         following_count = follower.following_relations.count()
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Callable, TypeVar
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, make_password
+from ninja.errors import HttpError
+
+from .models import User
+
+T = TypeVar('T')
+
+
+def _gevent_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class PasswordHashing:
+    """
+    在獨立的執行緒池計算密碼雜湊, 避免 PBKDF2 佔住處理請求的 worker
+    - hashlib 計算 PBKDF2 時會釋放 GIL, 執行緒池可以平行使用多個 CPU
+    - ASGI: 非同步端點以 await 等待結果, event loop 繼續處理其他請求
+    - gevent: threading 被 monkey patch 成 greenlet, 改用 gevent 的原生執行緒池,
+      等待結果時讓出 hub
+    - 同時進行的雜湊數超過 PASSWORD_HASH_QUEUE_LIMIT 時直接回傳 503, 不讓請求無限排隊
+    - 登入成功時, 密碼使用舊的演算法或迭代次數就重新雜湊
+    - PASSWORD_HASH_WORKERS 設為 0 時在目前的執行緒計算
+    """
+
+    _lock = threading.Lock()
+    _executor: ThreadPoolExecutor | None = None
+    _slots: threading.BoundedSemaphore | None = None
+
+    @classmethod
+    def _pool(cls) -> tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    if _gevent_patched():
+                        from gevent.threadpool import (
+                            ThreadPoolExecutor as GeventThreadPoolExecutor,
+                        )
+
+                        executor_class = GeventThreadPoolExecutor
+                    else:
+                        executor_class = ThreadPoolExecutor
+                    cls._slots = threading.BoundedSemaphore(
+                        settings.PASSWORD_HASH_QUEUE_LIMIT
+                    )
+                    cls._executor = executor_class(
+                        max_workers=settings.PASSWORD_HASH_WORKERS,
+                        thread_name_prefix='password-hash',
+                    )
+        return cls._executor, cls._slots
+
+    @classmethod
+    def _submit(cls, fn: Callable[..., T], *args) -> Future:
+        executor, slots = cls._pool()
+        # 執行中加上排隊中的數量已達上限
+        if not slots.acquire(blocking=False):
+            raise HttpError(503, '伺服器忙碌, 請稍後再試')
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # 等待逾時的工作仍會執行完, 完成或取消後才釋放名額
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    @classmethod
+    def _run(cls, fn: Callable[..., T], *args) -> T:
+        """
+        同步等待雜湊結果, 只在 gevent 下使用, 等待時會讓出 hub
+        """
+        if settings.PASSWORD_HASH_WORKERS <= 0:
+            return fn(*args)
+
+        future = cls._submit(fn, *args)
+        try:
+            return future.result(timeout=settings.PASSWORD_HASH_TIMEOUT)
+        except TimeoutError:
+            raise HttpError(503, '伺服器忙碌, 請稍後再試')
+
+    @classmethod
+    async def _arun(cls, fn: Callable[..., T], *args) -> T:
+        """
+        非同步等待雜湊結果, 不阻塞 event loop
+        """
+        if settings.PASSWORD_HASH_WORKERS <= 0:
+            return fn(*args)
+        if _gevent_patched():
+            # gevent 的 future 不能交給 asyncio, 同步等待時一樣會讓出 hub
+            return cls._run(fn, *args)
+
+        future = cls._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=settings.PASSWORD_HASH_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise HttpError(503, '伺服器忙碌, 請稍後再試')
+
+    @staticmethod
+    def _verify(raw_password: str, encoded: str) -> tuple[bool, str | None]:
+        """
+        驗證密碼, 需要升級時一併計算新的雜湊
+        :return: (是否正確, 新的雜湊或 None)
+        """
+        try:
+            hasher = identify_hasher(encoded)
+        except ValueError:
+            return False, None
+
+        if not hasher.verify(raw_password, encoded):
+            return False, None
+
+        preferred = get_hasher()
+        if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+            return True, make_password(raw_password)
+        return True, None
+
+    @classmethod
+    async def amake_password(cls, raw_password: str) -> str:
+        """
+        以預設的 hasher 雜湊密碼
+        """
+        return await cls._arun(make_password, raw_password)
+
+    @classmethod
+    async def acheck_password(cls, user: User, raw_password: str) -> bool:
+        """
+        和 user.check_password() 相同, 但在執行緒池計算雜湊
+        - 密碼需要升級時寫回資料庫
+        """
+        if not user.has_usable_password():
+            return False
+
+        is_correct, upgraded = await cls._arun(
+            cls._verify, raw_password, user.password
+        )
+        if upgraded is not None:
+            user.password = upgraded
+            await user.asave(update_fields=['password'])
+        return is_correct
+
+    @classmethod
+    async def aauthenticate(cls, email: str, raw_password: str) -> User | None:
+        """
+        以 email 和密碼驗證使用者, 對應 ModelBackend.authenticate()
+        - 未啟用的使用者回傳 None
+        """
+        user = await User.objects.filter(email=email).afirst()
+        if user is None:
+            # 使用者不存在時也雜湊一次, 避免以回應時間判斷 email 是否註冊
+            await cls.amake_password(raw_password)
+            return None
+
+        if await cls.acheck_password(user, raw_password) and user.is_active:
+            return user
+        return None
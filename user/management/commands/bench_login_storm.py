@@ -0,0 +1,108 @@
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        '對執行中的單一 worker 發送大量登入請求, 同時量測其他 API 的延遲. '
+        '分別以 PASSWORD_HASH_WORKERS=0 與預設值啟動伺服器並比較結果'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000', help='伺服器位址'
+        )
+        parser.add_argument('--email', required=True, help='登入用的帳號')
+        parser.add_argument('--password', required=True, help='登入用的密碼')
+        parser.add_argument(
+            '--probe-path', default='/api/homepage/highlight/', help='量測延遲的端點'
+        )
+        parser.add_argument('--logins', type=int, default=200, help='登入次數')
+        parser.add_argument(
+            '--concurrency', type=int, default=32, help='同時登入的請求數'
+        )
+        parser.add_argument('--probes', type=int, default=200, help='其他請求的次數')
+
+    def _send(self, request: urllib.request.Request) -> tuple[float, int]:
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, TimeoutError):
+            status = 0
+        return (time.perf_counter() - start) * 1000, status
+
+    def _probe_latencies(self, url: str, probes: int, done: threading.Event):
+        latencies = []
+        for _ in range(probes):
+            latencies.append(self._send(urllib.request.Request(url))[0])
+            if done.is_set():
+                break
+        return latencies
+
+    def _report(self, label: str, latencies: list[float], extra: str = '') -> None:
+        latencies = sorted(latencies)
+        p50 = statistics.median(latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f'{label}: 其他請求 {len(latencies)} 次, '
+            f'p50 {p50:.1f} ms, p99 {p99:.1f} ms{extra}'
+        )
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        probe_url = base_url + options['probe_path']
+        login_body = json.dumps(
+            {'email': options['email'], 'password': options['password']}
+        ).encode()
+
+        def login(_) -> int:
+            request = urllib.request.Request(
+                f'{base_url}/api/user/login/',
+                data=login_body,
+                headers={'Content-Type': 'application/json'},
+            )
+            return self._send(request)[1]
+
+        # 預熱, 並確認帳號密碼正確
+        if login(None) != 201:
+            self.stderr.write('登入失敗, 請確認帳號密碼與伺服器位址')
+            return
+
+        # 沒有登入請求時的基準延遲
+        never = threading.Event()
+        self._report('無登入', self._probe_latencies(probe_url, options['probes'], never))
+
+        statuses: list[int] = []
+        done = threading.Event()
+
+        def storm() -> None:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                statuses.extend(executor.map(login, range(options['logins'])))
+            done.set()
+
+        start = time.perf_counter()
+        runner = threading.Thread(target=storm)
+        runner.start()
+        latencies = self._probe_latencies(probe_url, options['probes'], done)
+        runner.join()
+        elapsed = time.perf_counter() - start
+
+        ok = statuses.count(201)
+        rejected = statuses.count(503)
+        self._report(
+            '登入期間',
+            latencies,
+            f', 登入 {ok / elapsed:.1f} 次/秒, 503 {rejected} 次, '
+            f'其他失敗 {len(statuses) - ok - rejected} 次',
+        )
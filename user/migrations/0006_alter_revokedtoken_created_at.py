@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0005_user_token_valid_after_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='revokedtoken',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import FileExtensionValidator
 from django.db import models
+from django.utils import timezone
 
 
 # 頭像上傳路徑設置
@@ -25,6 +26,8 @@ class User(AbstractUser):
         validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png'])],
     )
     is_active = models.BooleanField(default=False)  # 信箱驗證欄
+    # 在此時間之前簽發的 token 全部失效, 修改密碼時更新
+    token_valid_after = models.DateTimeField(null=True, blank=True)
 
     USERNAME_FIELD = 'email'  # 使用 email 作為登入的識別欄位
     REQUIRED_FIELDS = []  # 讓 email 變成唯一身份欄位
@@ -42,6 +45,15 @@ class User(AbstractUser):
         blank=True,
     )
 
+    def set_password(self, raw_password: str | None) -> None:
+        """
+        修改密碼, 之前簽發的 access token 和 refresh token 全部失效
+        - 使用 update_fields 儲存時要一併列出 token_valid_after
+        """
+        super().set_password(raw_password)
+        # token 的 iat 只有秒, 去掉微秒避免同一秒重新登入的 token 被判定失效
+        self.token_valid_after = timezone.now().replace(microsecond=0)
+
     def __str__(self) -> str:
         return self.email
 
@@ -61,3 +73,14 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.follower.username} → {self.following.username}'
+
+
+# 已撤銷的 token, 保留到 token 到期為止
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    # 各 process 依建立時間增量同步
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.jti} (到期: {self.expires_at})'
@@ -0,0 +1,140 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from shared.bloom import BloomFilter
+
+from .models import RevokedToken
+
+
+class TokenRevocation:
+    """
+    以 jti 撤銷 token 的黑名單
+    - 撤銷紀錄存在 RevokedToken, 保留到 token 到期為止
+    - 每個 process 在記憶體中保留一個 Bloom filter, 不在 filter 中的 jti 一定沒有被撤銷,
+      幾乎所有請求都不需要查詢資料庫
+    - 撤銷後遞增共用快取中的版本, 其他 process 最多 TOKEN_REVOCATION_SYNC_SECONDS 秒後
+      只查詢上次同步之後新增的紀錄, 加入既有的 filter
+    - 每 TOKEN_REVOCATION_REBUILD_SECONDS 秒或超過容量時才完整重建, 移除已到期的 jti
+    """
+
+    VERSION_KEY = 'user:revoked-tokens:version'
+    # 同步時往前多查的時間, 涵蓋建立時間早於上次同步但較晚才 commit 的紀錄
+    SYNC_OVERLAP = timedelta(seconds=60)
+
+    _lock = threading.Lock()
+    _bloom: BloomFilter | None = None
+    _capacity = 0
+    _count = 0  # filter 中的 jti 數量
+    _version: int | None = None
+    _synced_at: datetime | None = None  # 上次從資料庫同步的時間
+    _built_at = 0.0
+    _checked_at = 0.0
+
+    @classmethod
+    def _build(cls) -> None:
+        synced_at = timezone.now()
+        jtis = list(
+            RevokedToken.objects.filter(expires_at__gt=synced_at).values_list(
+                'jti', flat=True
+            )
+        )
+        # 預留成長空間, 撤銷數量超過容量時偽陽性會變高
+        cls._capacity = max(settings.TOKEN_REVOCATION_BLOOM_CAPACITY, len(jtis) * 2)
+        cls._bloom = BloomFilter.from_items(jtis, capacity=cls._capacity)
+        cls._count = len(jtis)
+        cls._synced_at = synced_at
+        cls._built_at = time.monotonic()
+
+    @classmethod
+    def _sync(cls) -> None:
+        """
+        只把上次同步之後新增的撤銷紀錄加入 filter
+        """
+        synced_at = timezone.now()
+        jtis = RevokedToken.objects.filter(
+            created_at__gt=cls._synced_at - cls.SYNC_OVERLAP,
+            expires_at__gt=synced_at,
+        ).values_list('jti', flat=True)
+        for jti in jtis:
+            if jti not in cls._bloom:
+                cls._bloom.add(jti)
+                cls._count += 1
+        cls._synced_at = synced_at
+
+    @classmethod
+    def _ensure_fresh(cls) -> BloomFilter:
+        def fresh() -> bool:
+            elapsed = time.monotonic() - cls._checked_at
+            return cls._bloom is not None and elapsed < interval
+
+        interval = settings.TOKEN_REVOCATION_SYNC_SECONDS
+        if fresh():
+            return cls._bloom
+
+        with cls._lock:
+            if fresh():
+                return cls._bloom
+
+            # 先讀版本再同步, 同步期間有新的撤銷時, 下次檢查會再同步一次
+            version = cache.get(cls.VERSION_KEY)
+            if version is None:
+                cache.add(cls.VERSION_KEY, time.time_ns(), timeout=None)
+                version = cache.get(cls.VERSION_KEY)
+            elapsed = time.monotonic() - cls._built_at
+            if (
+                cls._bloom is None
+                or elapsed > settings.TOKEN_REVOCATION_REBUILD_SECONDS
+                or cls._count > cls._capacity
+            ):
+                cls._build()
+            elif version != cls._version:
+                cls._sync()
+            cls._version = version
+            cls._checked_at = time.monotonic()
+            return cls._bloom
+
+    @classmethod
+    def is_revoked(cls, jti: str) -> bool:
+        """
+        檢查 token 是否已被撤銷
+        """
+        if jti not in cls._ensure_fresh():
+            return False
+        # Bloom filter 可能偽陽性, 再查詢資料庫確認
+        return RevokedToken.objects.filter(
+            jti=jti, expires_at__gt=timezone.now()
+        ).exists()
+
+    @classmethod
+    def revoke(cls, jti: str, expires_at: datetime) -> None:
+        """
+        撤銷 token, 到期時間之後紀錄會被清除
+        """
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True
+        )
+        with cls._lock:
+            if cls._bloom is not None and jti not in cls._bloom:
+                cls._bloom.add(jti)
+                cls._count += 1
+
+        def bump() -> None:
+            cache.set(cls.VERSION_KEY, time.time_ns(), timeout=None)
+
+        transaction.on_commit(bump)
+
+    @staticmethod
+    def purge_expired() -> int:
+        """
+        刪除已到期的撤銷紀錄
+        :return: 刪除的數量
+        """
+        expired = RevokedToken.objects.filter(expires_at__lte=timezone.now())
+        deleted, _ = expired.delete()
+        return deleted
@@ -40,6 +40,10 @@ class RefreshTokenRequest(Schema):
     refresh_token: str = Field(examples=['refresh_token'])
 
 
+class LogoutRequest(Schema):
+    refresh_token: str | None = Field(default=None, examples=['refresh_token'])
+
+
 class VerifyEmailRequest(Schema):
     active_token: str = Field(examples=['token123'])
 
@@ -0,0 +1,142 @@
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from shared.local_cache import LocalTTLCache
+
+from .models import Follow, User
+
+
+class UserCache:
+    """
+    認證用的使用者快取, 以 user_id 查詢
+    - 先查 process 內的 LRU, 再查共用快取, 都沒有才查詢資料庫
+    - 只快取常用欄位, 回傳的 User 其他欄位為 deferred, 讀取時才查詢資料庫
+    - 使用者儲存或刪除時由 signal 清除, 其他 process 的 LRU 最多延遲 USER_CACHE_LOCAL_TTL 秒
+    """
+
+    KEY = 'user:auth:{user_id}'
+    # 快取的欄位, 不包含密碼
+    FIELDS = (
+        'id',
+        'email',
+        'username',
+        'avatar',
+        'is_active',
+        'is_staff',
+        'is_superuser',
+        'token_valid_after',
+    )
+
+    _local = LocalTTLCache(
+        maxsize=settings.USER_CACHE_LOCAL_SIZE,
+        ttl=settings.USER_CACHE_LOCAL_TTL,
+    )
+
+    @classmethod
+    def _load(cls, user_id: int) -> Dict[str, Any] | None:
+        data = cls._local.get(user_id)
+        if data is not None:
+            return data
+
+        key = cls.KEY.format(user_id=user_id)
+        data = cache.get(key)
+        if data is None:
+            data = User.objects.filter(id=user_id).values(*cls.FIELDS).first()
+            if data is None:
+                return None
+            cache.set(key, data, timeout=settings.USER_CACHE_TIMEOUT)
+
+        cls._local.set(user_id, data)
+        return data
+
+    @classmethod
+    def get(cls, user_id: int) -> User | None:
+        """
+        取得使用者, 不存在時回傳 None
+        - 每次回傳新的 User 實例, 不會在請求之間共用
+        - 實例可能比資料庫舊, 寫入時必須使用 update_fields 只寫回修改的欄位
+        """
+        data = cls._load(user_id)
+        if data is None:
+            return None
+
+        # from_db 需要依照欄位定義的順序, 沒有給的欄位會是 deferred
+        field_names = [
+            field.attname
+            for field in User._meta.concrete_fields
+            if field.attname in data
+        ]
+        return User.from_db(
+            DEFAULT_DB_ALIAS, field_names, [data[name] for name in field_names]
+        )
+
+    @classmethod
+    def invalidate(cls, user_id: int) -> None:
+        """
+        使用者資料改變後清除快取, commit 後再清一次避免讀到尚未 commit 的資料
+        """
+
+        def clear() -> None:
+            cls._local.delete(user_id)
+            cache.delete(cls.KEY.format(user_id=user_id))
+
+        clear()
+        transaction.on_commit(clear)
+
+
+class FollowGraphCache:
+    """
+    使用者追蹤名單的快取, 用於文章可見性判斷
+    - 先查 process 內的 LRU, 再查共用快取, 都沒有才查詢資料庫
+    - 追蹤狀態改變時清除, 其他 process 的 LRU 最多延遲 FOLLOW_CACHE_LOCAL_TTL 秒
+    """
+
+    KEY = 'user:following:{user_id}'
+
+    _local = LocalTTLCache(
+        maxsize=settings.FOLLOW_CACHE_LOCAL_SIZE,
+        ttl=settings.FOLLOW_CACHE_LOCAL_TTL,
+    )
+
+    @classmethod
+    def get_following_ids(cls, user_id: int) -> frozenset[int]:
+        """
+        取得使用者追蹤的作者 id
+        """
+        following_ids = cls._local.get(user_id)
+        if following_ids is not None:
+            return following_ids
+
+        key = cls.KEY.format(user_id=user_id)
+        cached = cache.get(key)
+        if cached is None:
+            cached = list(
+                Follow.objects.filter(follower_id=user_id).values_list(
+                    'following_id', flat=True
+                )
+            )
+            cache.set(key, cached, timeout=settings.FOLLOW_CACHE_TIMEOUT)
+
+        following_ids = frozenset(cached)
+        cls._local.set(user_id, following_ids)
+        return following_ids
+
+    @classmethod
+    def is_following(cls, user_id: int, author_id: int) -> bool:
+        return author_id in cls.get_following_ids(user_id)
+
+    @classmethod
+    def invalidate(cls, user_id: int) -> None:
+        """
+        追蹤狀態改變後清除快取, commit 後再清一次避免讀到尚未 commit 的名單
+        """
+
+        def clear() -> None:
+            cls._local.delete(user_id)
+            cache.delete(cls.KEY.format(user_id=user_id))
+
+        clear()
+        transaction.on_commit(clear)
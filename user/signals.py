@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+from .services import UserCache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender: object, instance: User, **kwargs):
+    """
+    使用者儲存或刪除後, 清除認證用的快取
+    """
+    UserCache.invalidate(instance.id)
+
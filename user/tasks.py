@@ -0,0 +1,13 @@
+from celery import shared_task
+
+from .revocation import TokenRevocation
+
+
+@shared_task
+def purge_revoked_tokens() -> str:
+    """
+    Celery定時任務, 刪除已到期的 token 撤銷紀錄
+    """
+    deleted = TokenRevocation.purge_expired()
+    print(f'刪除 {deleted} 筆已到期的 token 撤銷紀錄')
+    return f'刪除 {deleted} 筆已到期的 token 撤銷紀錄'
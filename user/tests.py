@@ -1,3 +1,140 @@
-from django.test import TestCase
+import uuid
+from datetime import datetime, timedelta, timezone
 
-# Create your tests here.
+import jwt
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from ninja.errors import HttpError
+
+from shared.bloom import BloomFilter
+from YiyuanBlog.auth import (
+    ALGORITHM,
+    SECRET_KEY,
+    _user_from_token,
+    generate_access_token,
+    generate_refresh_token,
+    refreshed_token,
+    revoke_token,
+)
+
+from .models import RevokedToken, User
+from .revocation import TokenRevocation
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+def _access_token(user: User, issued_at: datetime) -> str:
+    # 指定簽發時間的 access token
+    return jwt.encode(
+        {
+            'user_id': user.id,
+            'email': user.email,
+            'type': 'access',
+            'jti': uuid.uuid4().hex,
+            'iat': issued_at,
+            'exp': issued_at + timedelta(hours=1),
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TokenRevocationTests(TestCase):
+    """
+    撤銷的 token 與修改密碼前簽發的 token 都要回傳 401
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@example.com', username='reader', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        # 每個測試重新從資料庫建立 Bloom filter
+        TokenRevocation._bloom = None
+
+    def assertUnauthorized(self, fn, *args):
+        with self.assertRaises(HttpError) as ctx:
+            fn(*args)
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    def test_unrevoked_token_passes(self):
+        token = generate_access_token(self.user.id, self.user.email)
+        self.assertEqual(_user_from_token(token).id, self.user.id)
+
+        refresh = generate_refresh_token(self.user.id, self.user.email)
+        self.assertTrue(refreshed_token(refresh))
+
+    def test_revoked_access_token_rejected(self):
+        token = generate_access_token(self.user.id, self.user.email)
+        revoke_token(token)
+
+        self.assertUnauthorized(_user_from_token, token)
+        response = self.client.get(
+            '/api/user/', HTTP_AUTHORIZATION=f'Bearer {token}'
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_revoked_token_rejected_after_bloom_rebuild(self):
+        token = generate_access_token(self.user.id, self.user.email)
+        revoke_token(token)
+
+        # 其他 process 從資料庫重新建立 Bloom filter
+        TokenRevocation._bloom = None
+        self.assertUnauthorized(_user_from_token, token)
+
+    def test_revocation_from_other_process_synced(self):
+        TokenRevocation.is_revoked('warm-up')  # 建立 Bloom filter
+        bloom = TokenRevocation._bloom
+
+        # 其他 process 撤銷 token: 寫入資料庫並遞增版本
+        RevokedToken.objects.create(
+            jti='revoked-elsewhere',
+            expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+        )
+        cache.set(TokenRevocation.VERSION_KEY, 0, timeout=None)
+        TokenRevocation._checked_at = 0.0
+
+        self.assertTrue(TokenRevocation.is_revoked('revoked-elsewhere'))
+        # 增量加入既有的 filter, 不重新建立
+        self.assertIs(TokenRevocation._bloom, bloom)
+
+    def test_revoked_refresh_token_rejected(self):
+        refresh = generate_refresh_token(self.user.id, self.user.email)
+        revoke_token(refresh)
+
+        self.assertUnauthorized(refreshed_token, refresh)
+
+    def test_token_issued_before_password_change_rejected(self):
+        issued_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+        old_token = _access_token(self.user, issued_at)
+
+        self.user.set_password('new-password')
+        self.user.save()
+
+        self.assertUnauthorized(_user_from_token, old_token)
+        # 修改密碼之後簽發的 token 可以使用
+        new_token = generate_access_token(self.user.id, self.user.email)
+        self.assertEqual(_user_from_token(new_token).id, self.user.id)
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives(self):
+        items = [uuid.uuid4().hex for _ in range(5000)]
+        bloom = BloomFilter.from_items(items, capacity=len(items))
+
+        self.assertTrue(all(item in bloom for item in items))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter.from_items(
+            (uuid.uuid4().hex for _ in range(5000)), capacity=5000, error_rate=0.01
+        )
+        absent = [uuid.uuid4().hex for _ in range(5000)]
+
+        false_positives = sum(1 for item in absent if item in bloom)
+        self.assertLess(false_positives / len(absent), 0.03)